@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# benchmark of AO clockline consolidation
+# compares clock computation time, generate_code time, file size and number of time arrays
+# of analog outputs with one clockline per address with consolidated clocklines (iPCdev.AO_consolidate).
+# usage: python ao_clocklines.py [--channels N [N ...]] [--density N] [--repeat N] [--json file]
+# note: like the example experiment this requires that iPCdev is located in the user_devices folder.
+
+import argparse
+import json
+import os
+import tempfile
+from time import perf_counter as get_ticks
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+
+from labscript import labscript_init, labscript_cleanup, start, stop
+from user_devices.iPCdev.labscript_devices import (
+    iPCdev,
+    DEVICE_DEVICES, DEVICE_PROFILE, DEVICE_TIME,
+    PROFILE_CLOCK, PROFILE_TOTAL,
+)
+
+# time grid of instructions in seconds
+TIME_STEP = 10e-6
+
+# layouts to compare
+LAYOUTS = {
+    'per-address' : False,
+    'consolidated': True,
+}
+
+def compile_shot(filename, device_class, channels, density, duration, seed=0):
+    """
+    compiles shot with one board with an AO bank of given number of channels.
+    each channel gets density constant values at random times.
+    returns dictionary with results.
+    """
+    labscript_init(filename, labscript_file=__file__, new=True, overwrite=True)
+    try:
+        board = device_class(name='board_0')
+        outputs = board.add_analog_bank(list(range(channels)), ['ao_%i' % channel for channel in range(channels)])
+        rng = np.random.default_rng(seed)
+        steps = int(duration / TIME_STEP)
+        t_start = get_ticks()
+        start()
+        for channel in outputs:
+            for step, value in zip(np.sort(rng.choice(np.arange(1, steps), size=density, replace=False)), rng.uniform(-10, 10, density)):
+                channel.constant(step * TIME_STEP, value)
+        stop(duration)
+        t_stop = get_ticks() - t_start
+    finally:
+        labscript_cleanup()
+    result = {'stop_s': t_stop, 'file_kB': os.path.getsize(filename) / 1024}
+    with h5py.File(filename, 'r') as f:
+        board = f[DEVICE_DEVICES]['board_0']
+        result['time_arrays'] = len([g for g in board.values() if isinstance(g, h5py.Group) and (DEVICE_TIME in g)])
+        result['time_samples'] = sum([len(g[DEVICE_TIME]) for g in board.values() if isinstance(g, h5py.Group) and (DEVICE_TIME in g)])
+        for (stage, name, duration_ms, peak_bytes) in board[DEVICE_PROFILE][()]:
+            stage = stage.decode()
+            if   stage == PROFILE_CLOCK: result['clock_ms']    = duration_ms
+            elif stage == PROFILE_TOTAL: result['generate_ms'] = duration_ms
+    return result
+
+def run(channels, density, duration, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, 'shot.h5')
+        for _channels in channels:
+            for name, consolidate in LAYOUTS.items():
+                device_class = type('iPCdev_' + name.replace('-','_'), (iPCdev,), {'AO_consolidate': consolidate})
+                runs = [compile_shot(filename, device_class, _channels, density, duration) for i in range(repeat)]
+                result = {'layout': name, 'channels': _channels, 'density': density, 'duration': duration}
+                for key in runs[0].keys():
+                    result[key] = min([r[key] for r in runs])
+                results.append(result)
+                print('%-12s channels %3i: clock %9.3f ms, generate %9.3f ms, %3i time arrays (%8i samples), file %8.1f kB' % (
+                      name, _channels, result['clock_ms'], result['generate_ms'], result['time_arrays'], result['time_samples'], result['file_kB']))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='iPCdev AO clockline consolidation benchmark')
+    parser.add_argument('--channels', type=int,   nargs='+', default=[8, 32], help='list of number of analog outputs')
+    parser.add_argument('--density',  type=int,   default=100,                help='number of instructions per channel')
+    parser.add_argument('--duration', type=float, default=0.1,                help='duration of each shot in seconds')
+    parser.add_argument('--repeat',   type=int,   default=3,                  help='number of repetitions. the minimum is taken.')
+    parser.add_argument('--json',     type=str,   default=None,               help='save results into given json file')
+    args = parser.parse_args()
+    results = run(args.channels, args.density, args.duration, args.repeat)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
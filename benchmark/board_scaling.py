@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# scaling benchmark and check of building the iPCdev connection table
+# creates boards with digital channels and measures the time of add_device and get_device per channel.
+# with the IM device index of get_device the time per channel must not grow with the number of boards and channels:
+# the largest time per channel must be at most --max-ratio times the smallest time per channel.
+# checks also the IM device index when boards give the same clockline name:
+# with shared_clocklines = False this must raise LabscriptError, with shared_clocklines = True the boards share the IM device.
+# usage: python board_scaling.py [--boards N [N ...]] [--channels N [N ...]] [--compile] [--max-ratio R] [--json file]
+# for the full check use: python board_scaling.py --boards 1 10 100 --channels 100 1000 10000
+# note: like the example experiment this requires that iPCdev is located in the user_devices folder.
+
+import argparse
+import itertools
+import json
+import os
+import tempfile
+from time import perf_counter as get_ticks
+
+from labscript import labscript_init, labscript_cleanup, start, stop, LabscriptError
+
+from user_devices.iPCdev.labscript_devices import iPCdev
+
+# number of digital channels per port
+PORT_CHANNELS = 16
+
+class scaling_iPCdev(iPCdev):
+    """
+    iPCdev measuring the inclusive time and the number of calls of add_device and get_device.
+    add_device includes get_device.
+    """
+    stats = {}
+
+    @classmethod
+    def reset_stats(cls):
+        cls.stats = {'add_device': [0.0, 0], 'get_device': [0.0, 0]}
+
+    @classmethod
+    def measure(cls, function, call):
+        # returns result of call() and adds its time to stats[function]
+        t_start = get_ticks()
+        result = call()
+        cls.stats[function][0] += get_ticks() - t_start
+        cls.stats[function][1] += 1
+        return result
+
+    def add_device(self, device, allow_create_new=True):
+        type(self).measure('add_device', lambda: iPCdev.add_device(self, device, allow_create_new))
+
+    def get_device(self, clockline_name, allow_create_new):
+        return type(self).measure('get_device', lambda: iPCdev.get_device(self, clockline_name, allow_create_new))
+
+class collision_iPCdev(iPCdev):
+    # digital clockline names without board name. all boards give the same clockline name for the same port.
+    def split_connection(self, channel):
+        clockline_name, hardware_info = iPCdev.split_connection(self, channel)
+        if (clockline_name is not None) and clockline_name.startswith(self.name + '_'):
+            clockline_name = 'common' + clockline_name[len(self.name):]
+        return clockline_name, hardware_info
+
+def build(device_class, boards, ports, channels):
+    """
+    creates boards with the given number of digital ports with channels each.
+    returns list of boards and list of digital channels.
+    """
+    primary = None
+    board_list = []
+    outputs = []
+    for b in range(boards):
+        board = device_class(name='board_%i' % b, parent_device=primary)
+        if primary is None: primary = board
+        board_list.append(board)
+        for port in range(ports):
+            outputs.extend(board.add_digital_port(port, ['do_%i_%i_%i' % (b, port, channel) for channel in range(channels)]))
+    return board_list, outputs
+
+def build_shot(filename, boards, channels, compile):
+    """
+    builds boards with channels digital channels each and optionally compiles the shot without instructions.
+    returns dictionary with measured times in seconds.
+    """
+    scaling_iPCdev.reset_stats()
+    labscript_init(filename, labscript_file=__file__, new=True, overwrite=True)
+    try:
+        t_start = get_ticks()
+        build(scaling_iPCdev, boards, (channels + PORT_CHANNELS - 1) // PORT_CHANNELS, PORT_CHANNELS)
+        t_build = get_ticks() - t_start
+        t_compile = 0.0
+        if compile:
+            t_start = get_ticks()
+            start()
+            stop(1e-3)
+            t_compile = get_ticks() - t_start
+    finally:
+        labscript_cleanup()
+    return {'build_s'         : t_build,
+            'add_device_s'    : scaling_iPCdev.stats['add_device'][0],
+            'add_device_calls': scaling_iPCdev.stats['add_device'][1],
+            'get_device_s'    : scaling_iPCdev.stats['get_device'][0],
+            'get_device_calls': scaling_iPCdev.stats['get_device'][1],
+            'compile_s'       : t_compile}
+
+def check_collision(filename):
+    """
+    builds two boards with the same clockline names with shared_clocklines = False and True.
+    returns list of error strings. empty if ok.
+    """
+    errors = []
+    for shared in [False, True]:
+        collision_iPCdev.shared_clocklines = shared
+        labscript_init(filename, labscript_file=__file__, new=True, overwrite=True)
+        try:
+            boards, outputs = build(collision_iPCdev, 2, 1, 2)
+        except LabscriptError as e:
+            if shared: errors.append('shared_clocklines = True: unexpected error: %s' % str(e))
+            else:      print('shared_clocklines = False: expected error: %s' % str(e).split('\n')[0])
+        else:
+            if not shared:
+                errors.append('shared_clocklines = False: same clockline name on two boards did not raise LabscriptError!')
+            elif len(set([id(channel.parent_device) for channel in outputs])) != 1:
+                errors.append('shared_clocklines = True: boards do not share the IM device!')
+            elif boards[0].get_device('common_do_0', False) is not outputs[0].parent_device:
+                errors.append('shared_clocklines = True: IM device index does not return the shared IM device!')
+            else:
+                print('shared_clocklines = True: boards share IM device %s' % outputs[0].parent_device.name)
+        finally:
+            labscript_cleanup()
+    collision_iPCdev.shared_clocklines = False
+    return errors
+
+def run(boards, channels, compile, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, 'shot.h5')
+        for (_boards, _channels) in itertools.product(boards, channels):
+            runs = [build_shot(filename, _boards, _channels, compile) for i in range(repeat)]
+            result = {'boards': _boards, 'channels': _channels}
+            for key in runs[0].keys():
+                result[key] = min([r[key] for r in runs])
+            # time per channel of add_device. this includes get_device.
+            result['add_device_us_per_channel'] = result['add_device_s'] * 1e6 / max(result['add_device_calls'], 1)
+            results.append(result)
+            print('boards %3i, channels %6i: build %9.3f s, add_device %9.3f s (%8i, %7.2f us/channel), get_device %8.3f s (%8i), compile %9.3f s' % (
+                  _boards, _channels, result['build_s'], result['add_device_s'], result['add_device_calls'],
+                  result['add_device_us_per_channel'], result['get_device_s'], result['get_device_calls'], result['compile_s']))
+        errors = check_collision(filename)
+    return results, errors
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='iPCdev connection table scaling benchmark')
+    parser.add_argument('--boards',    type=int,   nargs='+', default=[1, 10],     help='list of number of boards')
+    parser.add_argument('--channels',  type=int,   nargs='+', default=[100, 1000], help='list of number of digital channels per board')
+    parser.add_argument('--compile',   action='store_true',                        help='compile each shot without instructions')
+    parser.add_argument('--repeat',    type=int,   default=3,                      help='number of repetitions. the minimum time is taken.')
+    parser.add_argument('--max-ratio', type=float, default=3.0,                    help='maximum ratio of largest to smallest add_device time per channel')
+    parser.add_argument('--json',      type=str,   default=None,                   help='save results into given json file')
+    args = parser.parse_args()
+    results, errors = run(args.boards, args.channels, args.compile, args.repeat)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    per_channel = [result['add_device_us_per_channel'] for result in results]
+    ratio = max(per_channel) / min(per_channel)
+    print('add_device time per channel: ratio largest/smallest %.2f (limit %.2f)' % (ratio, args.max_ratio))
+    assert len(errors) == 0, '\n'.join(errors)
+    assert ratio <= args.max_ratio, 'add_device time per channel grows with boards and channels: ratio %.2f > %.2f!' % (ratio, args.max_ratio)
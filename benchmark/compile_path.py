@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# benchmark of the iPCdev compile path
+# compiles shots with synthetic connection tables and measures time and peak memory of
+# add_device, get_device, prepare_generate_code and of the stages of generate_code.
+# the topology is varied with the number of boards, ports, channels per port, AO clocklines, instruction density and shared_clocklines.
+# usage: python compile_path.py [--boards N [N ...]] [--ao-clocklines N [N ...]] [--density N [N ...]] [--shared 0 1] [--json file]
+# note: like the example experiment this requires that iPCdev is located in the user_devices folder.
+#       runmanager is not needed: compile_shot is a lightweight stand-in for the runmanager compilation of a shot.
+
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import tracemalloc
+from time import perf_counter as get_ticks
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+
+from labscript import labscript_init, labscript_cleanup, start, stop
+from user_devices.iPCdev.labscript_devices import (
+    iPCdev,
+    DEVICE_DEVICES, DEVICE_PROFILE, DEVICE_INFO_TYPE,
+    HARDWARE_TYPE, HARDWARE_TYPE_AO,
+    PROFILE_CLOCK, PROFILE_PREPARE, PROFILE_COMBINE, PROFILE_WRITE, PROFILE_STREAM, PROFILE_TOTAL,
+    PROFILE_CACHE, PROFILE_LOOPS, PROFILE_FLUSH,
+)
+
+# stages of the profiling table reported separately. PROFILE_TOTAL is reported as generate.
+PROFILE_STAGES = [PROFILE_PREPARE, PROFILE_CLOCK, PROFILE_COMBINE, PROFILE_WRITE, PROFILE_STREAM, PROFILE_CACHE, PROFILE_LOOPS, PROFILE_FLUSH]
+
+# time grid of instructions in seconds. all instructions are on this grid within the duration of the shot.
+TIME_STEP = 10e-6
+
+class bench_iPCdev(iPCdev):
+    """
+    iPCdev measuring the time and peak memory of add_device and get_device.
+    generate_code calls prepare_generate_code like a derived class would do.
+    prepare_generate_code and the stages of generate_code are measured with the profiling table.
+    """
+    profile_compile = True
+    profile_memory  = True
+    # inclusive time in seconds, number of calls and maximum peak memory in bytes of a call with key = function name.
+    # add_device includes get_device. the peak memory is measured when tracemalloc is running.
+    stats = {}
+    # stack of [memory, peak] of running calls. calls are nested like in iPCdev.profile_start.
+    stack = []
+
+    @classmethod
+    def reset_stats(cls):
+        cls.stats = {'add_device': [0.0, 0, 0], 'get_device': [0.0, 0, 0]}
+        cls.stack = []
+
+    @classmethod
+    def measure(cls, function, call):
+        """
+        returns result of call() and adds its time and peak memory above the memory at the start to stats[function].
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            memory, peak = tracemalloc.get_traced_memory()
+            if len(cls.stack) > 0:
+                cls.stack[-1][1] = max(cls.stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            cls.stack.append([memory, memory])
+        t_start = get_ticks()
+        result = call()
+        stat = cls.stats[function]
+        stat[0] += get_ticks() - t_start
+        stat[1] += 1
+        if tracing:
+            memory, peak = cls.stack.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if len(cls.stack) > 0:
+                cls.stack[-1][1] = max(cls.stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            stat[2] = max(stat[2], peak - memory)
+        return result
+
+    def add_device(self, device, allow_create_new=True):
+        type(self).measure('add_device', lambda: iPCdev.add_device(self, device, allow_create_new))
+
+    def get_device(self, clockline_name, allow_create_new):
+        return type(self).measure('get_device', lambda: iPCdev.get_device(self, clockline_name, allow_create_new))
+
+    def split_connection(self, channel):
+        clockline_name, hardware_info = iPCdev.split_connection(self, channel)
+        if type(self).shared_clocklines and (hardware_info[DEVICE_INFO_TYPE][HARDWARE_TYPE] == HARDWARE_TYPE_AO) and \
+           (clockline_name is not None) and clockline_name.startswith(self.name + '_'):
+            # AO clockline names without board name are shared by all boards.
+            # digital ports keep the clocklines of each board such that every board has its own clocklines.
+            clockline_name = 'shared' + clockline_name[len(self.name):]
+        return clockline_name, hardware_info
+
+    def generate_code(self, hdf5_file):
+        self.prepare_generate_code(hdf5_file)
+        iPCdev.generate_code(self, hdf5_file)
+
+def build(device_class, boards, ports, channels, ao_clocklines, ao_channels):
+    """
+    creates boards with the given number of digital ports with channels each and analog outputs.
+    the ao_channels of each board are distributed on ao_clocklines clocklines.
+    returns list of (digital channels, analog channels).
+    """
+    primary = None
+    outputs = ([], [])
+    for b in range(boards):
+        board = device_class(name='board_%i' % b, parent_device=primary)
+        if primary is None: primary = board
+        for port in range(ports):
+            outputs[0].extend(board.add_digital_port(port, ['do_%i_%i_%i' % (b, port, channel) for channel in range(channels)]))
+        for clockline in range(ao_clocklines):
+            addresses = list(range(clockline, ao_channels, ao_clocklines))
+            outputs[1].extend(board.add_analog_bank(addresses, ['ao_%i_%i' % (b, address) for address in addresses], clockline='ao%i' % clockline))
+    return outputs
+
+def sequence(outputs, density, duration, seed=0):
+    """
+    programs density instructions per channel at random times on the TIME_STEP grid.
+    returns stop time.
+    """
+    rng = np.random.default_rng(seed)
+    steps = int(duration / TIME_STEP)
+    do, ao = outputs
+    for channel in do:
+        for i, step in enumerate(np.sort(rng.choice(np.arange(1, steps), size=density, replace=False))):
+            if i & 1: channel.go_low(step * TIME_STEP)
+            else:     channel.go_high(step * TIME_STEP)
+    for channel in ao:
+        for step, value in zip(np.sort(rng.choice(np.arange(1, steps), size=density, replace=False)), rng.uniform(-10, 10, density)):
+            channel.constant(step * TIME_STEP, value)
+    return duration
+
+def compile_shot(filename, build_args, density, duration):
+    """
+    lightweight stand-in for the runmanager compilation of a shot:
+    creates a fresh shot file, builds the connection table and the sequence and generates the code.
+    returns dictionary with measured times in seconds and peak memory in bytes.
+    for each stage of the profiling table the total time in ms and the maximum peak memory is returned.
+    """
+    bench_iPCdev.reset_stats()
+    labscript_init(filename, labscript_file=__file__, new=True, overwrite=True)
+    try:
+        tracemalloc.start()
+        t_start = get_ticks()
+        outputs = build(bench_iPCdev, *build_args)
+        t_build = get_ticks() - t_start
+        build_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        t_start = get_ticks()
+        start()
+        stop(sequence(outputs, density, duration))
+        t_stop = get_ticks() - t_start
+    finally:
+        labscript_cleanup()
+    result = {'build_s'              : t_build,
+              'build_peak_bytes'     : build_peak,
+              'add_device_s'         : bench_iPCdev.stats['add_device'][0],
+              'add_device_calls'     : bench_iPCdev.stats['add_device'][1],
+              'add_device_peak_bytes': bench_iPCdev.stats['add_device'][2],
+              'get_device_s'         : bench_iPCdev.stats['get_device'][0],
+              'get_device_calls'     : bench_iPCdev.stats['get_device'][1],
+              'get_device_peak_bytes': bench_iPCdev.stats['get_device'][2],
+              'stop_s'               : t_stop}
+    # prepare_generate_code and stages of generate_code from the profiling table of each board.
+    # the generate_code of the primary board includes the secondary boards, so only the primary board is taken for the total.
+    with h5py.File(filename, 'r') as f:
+        stages   = {}
+        generate = None
+        for board in f[DEVICE_DEVICES].values():
+            if DEVICE_PROFILE not in board: continue
+            for (stage, name, duration_ms, peak_bytes) in board[DEVICE_PROFILE][()]:
+                stage = stage.decode()
+                if stage == PROFILE_TOTAL:
+                    if (generate is None) or (duration_ms > generate[0]):
+                        generate = (duration_ms, peak_bytes)
+                    continue
+                if stage not in stages: stages[stage] = [0.0, 0]
+                stages[stage][0] += duration_ms
+                stages[stage][1]  = max(stages[stage][1], int(peak_bytes))
+    for stage in PROFILE_STAGES:
+        ms, peak_bytes = stages.get(stage, (0.0, 0))
+        result.update({stage + '_ms': ms, stage + '_peak_bytes': peak_bytes})
+    result.update({'generate_ms'        : generate[0],
+                   'generate_peak_bytes': int(generate[1]),
+                   'file_kB'            : os.path.getsize(filename) / 1024})
+    return result
+
+def run(boards, ports, channels, ao_clocklines, ao_channels, density, duration, shared, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, 'shot.h5')
+        for (_boards, _ao_clocklines, _density, _shared) in itertools.product(boards, ao_clocklines, density, shared):
+            bench_iPCdev.shared_clocklines = bool(_shared)
+            build_args = (_boards, ports, channels, _ao_clocklines, ao_channels)
+            runs = [compile_shot(filename, build_args, _density, duration) for i in range(repeat)]
+            # minimum of times, maximum of memory
+            result = {'boards': _boards, 'ports': ports, 'channels': channels, 'ao_clocklines': _ao_clocklines,
+                      'ao_channels': ao_channels, 'density': _density, 'duration': duration, 'shared_clocklines': bool(_shared)}
+            for key in runs[0].keys():
+                result[key] = max([r[key] for r in runs]) if key.endswith('bytes') else min([r[key] for r in runs])
+            results.append(result)
+            print('boards %2i, AO clocklines %2i, density %5i, shared %i: add_device %8.3f ms (%i, peak %.1f kB), get_device %8.3f ms (%i, peak %.1f kB), '
+                  'prepare %8.3f ms (peak %.1f kB), generate %9.3f ms (peak %.1f kB), file %8.1f kB' % (
+                  _boards, _ao_clocklines, _density, _shared,
+                  result['add_device_s']*1e3, result['add_device_calls'], result['add_device_peak_bytes']/1024,
+                  result['get_device_s']*1e3, result['get_device_calls'], result['get_device_peak_bytes']/1024,
+                  result['prepare_ms'], result['prepare_peak_bytes']/1024, result['generate_ms'], result['generate_peak_bytes']/1024, result['file_kB']))
+            print('  stages: ' + ', '.join(['%s %.3f ms (peak %.1f kB)' % (stage, result[stage + '_ms'], result[stage + '_peak_bytes']/1024) for stage in PROFILE_STAGES]))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='iPCdev compile path benchmark')
+    parser.add_argument('--boards',        type=int,   nargs='+', default=[1, 4],    help='list of number of boards')
+    parser.add_argument('--ports',         type=int,   default=2,                    help='number of digital ports per board')
+    parser.add_argument('--channels',      type=int,   default=16,                   help='number of digital channels per port')
+    parser.add_argument('--ao-clocklines', type=int,   nargs='+', default=[1, 8],    help='list of number of AO clocklines per board')
+    parser.add_argument('--ao-channels',   type=int,   default=8,                    help='number of analog outputs per board')
+    parser.add_argument('--density',       type=int,   nargs='+', default=[10, 100], help='list of number of instructions per channel')
+    parser.add_argument('--duration',      type=float, default=0.1,                  help='duration of each shot in seconds')
+    parser.add_argument('--shared',        type=int,   nargs='+', default=[0, 1],    help='list of shared_clocklines settings (0 or 1)')
+    parser.add_argument('--repeat',        type=int,   default=3,                    help='number of repetitions. the minimum time is taken.')
+    parser.add_argument('--json',          type=str,   default=None,                 help='save results into given json file')
+    args = parser.parse_args()
+    results = run(args.boards, args.ports, args.channels, args.ao_clocklines, args.ao_channels,
+                  args.density, args.duration, args.shared, args.repeat)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
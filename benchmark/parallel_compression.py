@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# check and benchmark of parallel compression of iPCdev datasets
+# compiles the same synthetic shot with compress_workers = 0 (serial HDF5 filters) and with the given numbers of workers.
+# all datasets of the device groups must be byte-identical, i.e. have the same raw chunks and attributes.
+# reports generate_code time and peak memory for each number of workers.
+# usage: python parallel_compression.py [--workers N [N ...]] [--json file]
+# note: like the example experiment this requires that iPCdev is located in the user_devices folder.
+
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+
+from user_devices.iPCdev.labscript_devices import (
+    DEVICE_DEVICES, DEVICE_PROFILE,
+    STORAGE_CHUNKS, STORAGE_SHUFFLE, STORAGE_COMPRESSION, STORAGE_LEVEL,
+)
+
+from compile_path import bench_iPCdev, compile_shot
+
+# storage policy with chunks compressed by gzip and shuffle which can be compressed in parallel
+POLICY = {STORAGE_CHUNKS: 1<<14, STORAGE_SHUFFLE: True, STORAGE_COMPRESSION: 'gzip', STORAGE_LEVEL: 4}
+
+def read_raw(f):
+    """
+    returns dictionary with key = dataset path, value = (dtype, shape, chunks, filters, attributes, raw chunks or data)
+    of all datasets of the device groups in opened h5 file f. the profiling tables are skipped since they contain times.
+    """
+    datasets = {}
+    def visit(name, obj):
+        if not isinstance(obj, h5py.Dataset) or (name.split('/')[-1] == DEVICE_PROFILE): return
+        attrs = {key: np.asarray(value).tobytes() for key, value in obj.attrs.items()}
+        if obj.chunks is None:
+            content = [obj[()].tobytes()]
+        else:
+            content = [obj.id.read_direct_chunk(obj.id.get_chunk_info(i).chunk_offset) for i in range(obj.id.get_num_chunks())]
+        datasets[name] = (obj.dtype.str, obj.shape, obj.chunks, obj.compression, obj.shuffle, attrs, content)
+    f[DEVICE_DEVICES].visititems(visit)
+    return datasets
+
+def run(workers, build_args, density, duration):
+    results = []
+    bench_iPCdev.storage_policy      = POLICY
+    bench_iPCdev.stream_memory_limit = None
+    with tempfile.TemporaryDirectory() as folder:
+        reference = None
+        for _workers in [0] + workers:
+            filename = os.path.join(folder, 'shot_%i.h5' % _workers)
+            bench_iPCdev.compress_workers = _workers
+            result = compile_shot(filename, build_args, density, duration)
+            with h5py.File(filename, 'r') as f:
+                raw = read_raw(f)
+            if reference is None:
+                reference = raw
+                identical = True
+            else:
+                identical = (raw == reference)
+                if not identical:
+                    for name in sorted(set(raw.keys()) | set(reference.keys())):
+                        if raw.get(name) != reference.get(name):
+                            print('different dataset:', name)
+            result.update({'workers': _workers, 'identical': identical, 'datasets': len(raw)})
+            results.append(result)
+            print('workers %2i: generate %9.3f ms, peak %10.1f kB, file %10.1f kB, %i datasets %s' % (
+                  _workers, result['generate_ms'], result['generate_peak_bytes']/1024, result['file_kB'],
+                  len(raw), 'identical' if identical else 'DIFFERENT'))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='iPCdev parallel compression check and benchmark')
+    parser.add_argument('--workers',  type=int,   nargs='+', default=[1, 4], help='list of number of compression workers')
+    parser.add_argument('--boards',   type=int,   default=2,                 help='number of boards')
+    parser.add_argument('--ports',    type=int,   default=4,                 help='number of digital ports per board')
+    parser.add_argument('--channels', type=int,   default=16,                help='number of digital channels per port')
+    parser.add_argument('--ao',       type=int,   default=16,                help='number of analog outputs per board on 4 clocklines')
+    parser.add_argument('--density',  type=int,   default=1000,              help='number of instructions per channel')
+    parser.add_argument('--duration', type=float, default=1.0,               help='duration of each shot in seconds')
+    parser.add_argument('--json',     type=str,   default=None,              help='save results into given json file')
+    args = parser.parse_args()
+    results = run(args.workers, (args.boards, args.ports, args.channels, 4, args.ao), args.density, args.duration)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    assert all([result['identical'] for result in results]), 'parallel compression output differs from serial output!'
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# benchmark of iPCdev storage policies
+# compares write time, read time and file size for synthetic datasets representative for a shot.
+# usage: python storage_policy.py [--samples N] [--repeat N] [--json file]
+# note: like the example experiment this requires that iPCdev is located in the user_devices folder.
+
+import argparse
+import json
+import os
+import tempfile
+from time import perf_counter as get_ticks
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+
+from user_devices.iPCdev.labscript_devices import (
+    iPCdev,
+    STORAGE_ADAPTIVE, STORAGE_CHUNKS, STORAGE_SHUFFLE, STORAGE_COMPRESSION, STORAGE_LEVEL,
+)
+
+# policies to compare
+POLICIES = {
+    'default'   : None,
+    'gzip4+shuf': {STORAGE_CHUNKS: 1<<16, STORAGE_SHUFFLE: True, STORAGE_COMPRESSION: 'gzip', STORAGE_LEVEL: 4},
+    'lzf+shuf'  : {STORAGE_CHUNKS: 1<<16, STORAGE_SHUFFLE: True, STORAGE_COMPRESSION: 'lzf'},
+    'adaptive'  : STORAGE_ADAPTIVE,
+}
+
+def make_shot(samples, seed=0):
+    """
+    returns dictionary with key = dataset name, value = data of a synthetic shot with given number of samples.
+    """
+    rng = np.random.default_rng(seed)
+    # clockline times with irregular spacing
+    time = np.round(np.cumsum(rng.integers(1, 100, samples) * 1e-6), 10)
+    # digital port with only few changes
+    do_sparse = np.zeros(samples, dtype=np.uint32)
+    for index in np.sort(rng.integers(0, samples, 20)):
+        do_sparse[index:] ^= np.uint32(1 << int(rng.integers(0, 16)))
+    # digital port with one fast toggling bit
+    do_fast = do_sparse ^ (np.arange(samples, dtype=np.uint32) & 1)
+    # analog output with linear ramps
+    ao_ramp = np.interp(np.arange(samples), np.linspace(0, samples, 11), rng.uniform(-10, 10, 11))
+    # analog output mostly constant
+    ao_const = np.full(samples, 1.5)
+    ao_const[samples//2:] = -2.5
+    return {'time': time, 'do_sparse': do_sparse, 'do_fast': do_fast, 'ao_ramp': ao_ramp, 'ao_const': ao_const}
+
+def run(samples, repeat):
+    shot = make_shot(samples)
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for name, policy in POLICIES.items():
+            device_class = type('iPCdev_' + name.replace('+','_'), (iPCdev,), {'storage_policy': policy})
+            filename = os.path.join(folder, name.replace('+','_') + '.h5')
+            t_write = []
+            t_read  = []
+            for i in range(repeat):
+                t_start = get_ticks()
+                with h5py.File(filename, 'w') as f:
+                    for dataset, data in shot.items():
+                        f.create_dataset(dataset, data=data, **device_class.get_storage_options(dataset, data))
+                t_write.append(get_ticks() - t_start)
+                t_start = get_ticks()
+                with h5py.File(filename, 'r') as f:
+                    for dataset in shot.keys():
+                        f[dataset][()]
+                t_read.append(get_ticks() - t_start)
+            result = {'policy'  : name,
+                      'samples' : samples,
+                      'write_ms': np.min(t_write) * 1e3,
+                      'read_ms' : np.min(t_read) * 1e3,
+                      'size_kB' : os.path.getsize(filename) / 1024,
+                      'raw_kB'  : sum([data.nbytes for data in shot.values()]) / 1024}
+            results.append(result)
+            print('%-12s write %9.3f ms, read %9.3f ms, size %10.1f kB (raw %.1f kB)' % (
+                  name, result['write_ms'], result['read_ms'], result['size_kB'], result['raw_kB']))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='iPCdev storage policy benchmark')
+    parser.add_argument('--samples', type=int, default=1000000, help='number of samples per dataset')
+    parser.add_argument('--repeat',  type=int, default=3,       help='number of repetitions. the minimum time is taken.')
+    parser.add_argument('--json',    type=str, default=None,    help='save results into given json file')
+    args = parser.parse_args()
+    results = run(args.samples, args.repeat)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
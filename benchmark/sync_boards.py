@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# simulation of iPCdev_worker.sync_boards with many boards in a single process
+# each board runs sync_boards in its own thread and calls it after a random delay within the given skew.
+# the zprocess events are replaced by in-process events with the same post(id, data) and wait(id, timeout) interface.
+# reports the duration and the status of each board and compares the boards marked as late by the primary board
+# with the boards which actually arrived after the deadline of the primary board.
+# with the tree (--fanout > 0) also the boards below a late board are marked as late since their events cannot be forwarded.
+# no other boards must be marked as late, independent of the time the boards in between have called sync_boards.
+# checks also the kind of sync: one board skips the shot broker sync and does only the following exp_time sync,
+# like a board which was out of step. no board must accept a payload of the other kind of sync.
+# usage: python sync_boards.py [--boards N [N ...]] [--fanout N [N ...]] [--skew s] [--late N] [--json file]
+# note: like the example experiment this requires that iPCdev is located in the user_devices folder.
+
+import argparse
+import itertools
+import json
+import threading
+from time import perf_counter as get_ticks, sleep
+
+import numpy as np
+from zprocess.utils import TimeoutError as zTimeoutError
+
+from user_devices.iPCdev import blacs_workers
+from user_devices.iPCdev.blacs_workers import iPCdev_worker, SYNC_RESULT_OK, SYNC_KIND_BROKER, SYNC_KIND_TIME, EVENT_TIMEOUT
+
+# globals which iPCdev_worker.init imports in the worker process
+blacs_workers.zTimeoutError = zTimeoutError
+blacs_workers.get_ticks     = get_ticks
+
+class sim_event(object):
+    """
+    in-process event with the interface of zprocess.Event. posted data is queued until it is waited for.
+    wait(id) returns the data of the first queued post with this id. posts with other ids are discarded like in zprocess.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queue     = []
+
+    def post(self, id, data=None):
+        with self.condition:
+            self.queue.append((id, data))
+            self.condition.notify_all()
+
+    def wait(self, id, timeout=None):
+        deadline = None if timeout is None else get_ticks() + timeout
+        with self.condition:
+            while True:
+                while len(self.queue) > 0:
+                    _id, data = self.queue.pop(0)
+                    if _id == id: return data
+                remaining = None if deadline is None else deadline - get_ticks()
+                if (remaining is not None) and (remaining <= 0):
+                    raise zTimeoutError('timeout waiting for event %s' % str(id))
+                self.condition.wait(remaining)
+
+class sim_process_tree(object):
+    # returns the same sim_event for the same event name like zprocess.ProcessTree.event
+    def __init__(self):
+        self.events = {}
+
+    def event(self, name, role='wait'):
+        return self.events.setdefault(name, sim_event())
+
+def create_workers(boards, fanout):
+    """
+    returns list of iPCdev_worker for given number of boards with sync_tree_fanout = fanout.
+    the first board is the primary board. only the attributes needed by sync_boards are initialized.
+    """
+    worker_class = type('sim_worker', (iPCdev_worker,), {'sync_tree_fanout': fanout})
+    names = ['board_%i' % i for i in range(boards)]
+    process_tree = sim_process_tree()
+    workers = []
+    for name in names:
+        worker = object.__new__(worker_class)
+        worker.device_name  = name
+        worker.is_primary   = (name == names[0])
+        worker.boards       = names[1:] if worker.is_primary else names[:1]
+        worker.properties   = {'all_boards': names}
+        worker.process_tree = process_tree
+        worker.sync_late    = []
+        worker.create_events()
+        workers.append(worker)
+    return workers
+
+def is_unreachable(worker, workers, late_boards):
+    # returns True if worker or any board between worker and the primary board is in late_boards
+    parents = {_worker.device_name: (None if _worker.tree is None else _worker.tree[0]) for _worker in workers}
+    board = worker.device_name
+    while board is not None:
+        if board in late_boards: return True
+        board = parents[board]
+    return False
+
+def run_sync(workers, delays, timeout):
+    """
+    calls sync_boards of all workers in separate threads after the given delays in seconds.
+    returns list of (start time, status, late boards, duration in ms) for each worker.
+    start times are relative to the start of the primary board.
+    """
+    results = [None]*len(workers)
+    t_start = get_ticks()
+    def sync(index):
+        sleep(delays[index])
+        t = get_ticks() - t_start
+        (status, result, duration) = workers[index].sync_boards(payload=workers[index].device_name, timeout=timeout, reset_event_counter=True)
+        results[index] = (t, status, list(workers[index].sync_late), duration)
+    threads = [threading.Thread(target=sync, args=(index,)) for index in range(len(workers))]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    t_primary = results[0][0]
+    return [(t - t_primary, status, late, duration) for (t, status, late, duration) in results]
+
+def run(boards, fanouts, skew, late, timeout, repeat, seed):
+    rng = np.random.default_rng(seed)
+    results = []
+    for (_boards, _fanout) in itertools.product(boards, fanouts):
+        for i in range(repeat):
+            # new workers and events for each run such that events of late boards of the last run are not received
+            workers = create_workers(_boards, _fanout)
+            # primary board starts first. late boards start after the deadline of the primary board.
+            delays = np.concatenate(([0.0], rng.uniform(0.0, skew, _boards - 1)))
+            for index in rng.choice(np.arange(1, _boards), size=min(late, _boards - 1), replace=False):
+                delays[index] = timeout + skew
+            runs = run_sync(workers, delays, timeout)
+            late_boards = set([workers[index].device_name for index, (t, status, _late, duration) in enumerate(runs) if t > timeout])
+            expected = sorted([worker.device_name for worker in workers if is_unreachable(worker, workers, late_boards)])
+            marked   = sorted(runs[0][2])
+            result = {'boards'     : _boards,
+                      'fanout'     : _fanout,
+                      'run'        : i,
+                      'ok'         : sum([status == SYNC_RESULT_OK for (t, status, _late, duration) in runs]),
+                      'late'       : sorted(late_boards),
+                      'expected'   : expected,
+                      'marked'     : marked,
+                      'correct'    : marked == expected,
+                      'primary_ms' : runs[0][3],
+                      'max_ms'     : max([duration for (t, status, _late, duration) in runs])}
+            results.append(result)
+            print('boards %4i, fanout %2i, run %2i: %4i ok, late %3i unreachable %3i marked %3i (%s), primary %8.3f ms, max %8.3f ms' % (
+                  _boards, _fanout, i, result['ok'], len(late_boards), len(expected), len(marked), 'correct' if result['correct'] else 'WRONG',
+                  result['primary_ms'], result['max_ms']))
+    return results
+
+def run_skip(boards, fanouts, timeout, seed):
+    """
+    one random secondary board skips the shot broker sync and calls only the exp_time sync.
+    all other boards call the broker sync and then the exp_time sync. each payload is (kind, board name).
+    returns list of results with the number of payloads of the wrong kind received by any board and the errors.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for (_boards, _fanout) in itertools.product(boards, fanouts):
+        if _boards < 2: continue
+        workers = create_workers(_boards, _fanout)
+        skip = int(rng.integers(1, _boards))
+        received = [[] for worker in workers]
+        errors = []
+        broker_late = []
+        def sync(index):
+            worker = workers[index]
+            try:
+                for kind in [SYNC_KIND_BROKER, SYNC_KIND_TIME]:
+                    if (kind == SYNC_KIND_BROKER) and (index == skip): continue
+                    (status, result, duration) = worker.sync_boards(payload=(kind, worker.device_name), timeout=timeout, reset_event_counter=True, kind=kind)
+                    received[index].append((kind, result))
+                    if (kind == SYNC_KIND_BROKER) and worker.is_primary:
+                        broker_late.extend(worker.sync_late)
+            except Exception as e:
+                errors.append('%s: %s' % (worker.device_name, repr(e)))
+        threads = [threading.Thread(target=sync, args=(index,)) for index in range(len(workers))]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        wrong = 0
+        for _received in received:
+            for (kind, result) in _received:
+                if result is None: continue
+                wrong += sum([not (isinstance(payload, str) and (payload == EVENT_TIMEOUT)) and (payload[0] != kind) for payload in result.values()])
+        result = {'boards'     : _boards,
+                  'fanout'     : _fanout,
+                  'skip'       : workers[skip].device_name,
+                  'broker_late': sorted(broker_late),
+                  'wrong_kind' : wrong,
+                  'errors'     : errors}
+        results.append(result)
+        print('boards %4i, fanout %2i, skip %s: broker late %3i, wrong kind %i, errors %i' % (
+              _boards, _fanout, result['skip'], len(broker_late), wrong, len(errors)))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='iPCdev sync_boards simulation')
+    parser.add_argument('--boards',  type=int,   nargs='+', default=[4, 32], help='list of number of boards')
+    parser.add_argument('--fanout',  type=int,   nargs='+', default=[0, 2],  help='list of sync_tree_fanout. 0 = no tree.')
+    parser.add_argument('--skew',    type=float, default=0.2,                help='maximum delay in seconds of the start of the secondary boards')
+    parser.add_argument('--late',    type=int,   default=0,                  help='number of boards which start after the timeout')
+    parser.add_argument('--timeout', type=float, default=0.5,                help='timeout in seconds of sync_boards')
+    parser.add_argument('--repeat',  type=int,   default=3,                  help='number of runs for each configuration')
+    parser.add_argument('--seed',    type=int,   default=0,                  help='seed of random delays')
+    parser.add_argument('--json',    type=str,   default=None,               help='save results into given json file')
+    args = parser.parse_args()
+    results = run(args.boards, args.fanout, args.skew, args.late, args.timeout, args.repeat, args.seed)
+    results_skip = run_skip(args.boards, args.fanout, args.timeout, args.seed)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump({'sync': results, 'skip': results_skip}, f, indent=2)
+    assert all([result['correct'] for result in results]), 'primary board marked wrong boards as late!'
+    for result in results_skip:
+        assert len(result['errors']) == 0, '\n'.join(result['errors'])
+        assert result['wrong_kind'] == 0, 'boards accepted %i payloads of the wrong kind of sync!' % result['wrong_kind']
+        assert result['skip'] in result['broker_late'], 'primary board did not mark %s which skipped the broker sync as late!' % result['skip']
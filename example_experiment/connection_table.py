@@ -36,9 +36,9 @@ for parent in [device_0, device_1]:
         do_count[0] += 1
     addr += 1
 
-    for channel in range(16):
-        DigitalOut(name = 'digital_out_%i'%do_count[0], parent_device = parent, connection = '0x%x/0x%x'%(addr, channel))
-        do_count[0] += 1
+    # the same can be done faster with add_digital_port which parses the connection only once per port
+    parent.add_digital_port(addr, ['digital_out_%i'%(do_count[0] + channel) for channel in range(16)])
+    do_count[0] += 16
     addr += 1
 
     # analog outputs
@@ -31,7 +31,7 @@ if __name__ == '__main__':
 
         # define some times in seconds
         wait_between_digital = True
-        experiment_time = 5   # for >30s we run out of memory!
+        experiment_time = 5   # for >30s we run out of memory! see iPCdev.stream_memory_limit
 
         offset_voltage = 2.0
 
@@ -3,6 +3,12 @@
 # last change 14/6/2024 by Andi
 
 import numpy as np
+import os
+import re
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+from multiprocessing import shared_memory, resource_tracker
 import labscript_utils.h5_lock
 import h5py
 from zprocess import Event
@@ -14,9 +20,10 @@ from blacs.tab_base_classes import Worker
 
 import logging
 from .labscript_devices import (
-    log_level,
+    iPCdev, log_level,
+    DEVICE_DEVICES, DEVICE_SEP, DEVICE_STATIC, DEVICE_STATS, DEVICE_HASH,
     DEVICE_INFO_PATH, DEVICE_TIME, DEVICE_HARDWARE_INFO, DEVICE_INFO_ADDRESS, DEVICE_INFO_TYPE, DEVICE_INFO_BOARD,
-    DEVICE_DATA_AO, DEVICE_DATA_DO, DEVICE_DATA_DDS,
+    DEVICE_DATA_AO, DEVICE_DATA_DO, DEVICE_DATA_DDS, DEVICE_DATA_DDS_COMPOUND, DEVICE_INFO_COMPOUND, DEVICE_INFO_SCALE,
     HARDWARE_TYPE, HARDWARE_SUBTYPE,
     HARDWARE_TYPE_AO, HARDWARE_TYPE_DO, HARDWARE_TYPE_DDS,
     HARDWARE_SUBTYPE_STATIC, HARDWARE_SUBTYPE_TRIGGER,
@@ -31,6 +38,8 @@ from time import sleep
 # optional worker_args
 ARG_SIM  = 'simulate'
 ARG_SYNC = 'sync_boards'
+ARG_PREFETCH = 'prefetch'
+ARG_BROKER   = 'broker'
 
 # default update time interval in seconds when status monitor shows actual status
 UPDATE_TIME                     = 1.0
@@ -46,15 +55,69 @@ SYNC_TIMEOUT                    = 1.0
 #       so its not so easy to detect if it is working now or not.
 SYNC_RESET_EACH_RUN             = True
 
+# maximum number of children per board when sync_boards uses a tree of boards. 0 = all boards wait for the primary board.
+# with a tree the primary board sends the result only to its children which forward it. see iPCdev_worker.sync_tree.
+# benchmark/sync_boards.py simulates the tree with many boards and skewed arrival times.
+SYNC_TREE_FANOUT                = 0
+
 # time margin for sync_boards with reset_event_counter=True
 # this is not used with SYNC_RESET_EACH_RUN
 SYNC_TIME_MARGIN                = 0.2
 
+# prefetch of next shot: maximum time in seconds the prefetch thread waits for the next shot file
+# and polling interval in seconds while waiting.
+PREFETCH_TIMEOUT                = 30.0
+PREFETCH_POLL                   = 0.1
+# prefetch is stopped after this number of consecutive misses, i.e. when the guessed next shot file was not the next shot.
+# a miss of a decoded shot costs a full read of the guessed file. prefetch is started again with a fresh reload of the shot.
+PREFETCH_MAX_MISSES             = 3
+
+# cache of decoded shots: maximum memory in bytes of the cached port data and maximum number of shots.
+# least recently used shots are removed first. the cache is disabled with SHOT_CACHE_MEMORY = 0.
+# to enable the cache set shot_cache_memory > 0 in a derived worker class. the key of a shot is fastest
+# with iPCdev.deduplicate = True which saves the DEVICE_HASH attribute, otherwise the stored bytes are hashed. see get_shot_key.
+SHOT_CACHE_MEMORY               = 0
+SHOT_CACHE_ENTRIES              = 16
+
+# keys of shot dictionary returned by read_shot
+SHOT_ID                         = 'id'
+SHOT_FILE                       = 'file'
+SHOT_STAT                       = 'stat'
+SHOT_EXP_TIME                   = 'exp_time'
+SHOT_CHANNELS                   = 'num_channels'
+SHOT_PORTS                      = 'ports'
+SHOT_FINAL                      = 'final_values'
+SHOT_KEY                        = 'key'
+SHOT_SIZE                       = 'size'
+
+# shot broker: timeout in seconds secondary boards wait for the primary board to publish the shot.
+# this includes the time the primary board needs to read and decode the data of all boards.
+BROKER_TIMEOUT                  = 10.0
+# alignment in bytes of arrays in shared memory
+BROKER_ALIGN                    = 64
+
+# keys of shot descriptor published by the primary board
+BROKER_NAME                     = 'name'
+BROKER_ID                       = 'id'
+BROKER_ARRAYS                   = 'arrays'
+BROKER_INLINE                   = 'inline'
+
 # events
 EVENT_TO_PRIMARY                = '%s_to_prim'
 EVENT_FROM_PRIMARY              = '%s_from_prim'
 EVENT_TIMEOUT                   = 'timeout!'
 EVENT_COUNT_INITIAL             = 0
+# keys of event data: kind of sync and data
+EVENT_KIND                      = 'kind'
+EVENT_DATA                      = 'data'
+
+# kind of sync_boards. events of another kind are discarded.
+# with SYNC_RESET_EACH_RUN all syncs use the same event id and a board which is out of step
+# (e.g. after a restart) could otherwise send its payload to another kind of sync.
+SYNC_KIND_DEFAULT               = 'sync'
+SYNC_KIND_BROKER                = 'broker'
+SYNC_KIND_TIME                  = 'exp_time'
+SYNC_KIND_STATUS                = 'status'
 
 # return code from sync_boards
 SYNC_RESULT_OK                  = 0     # ok
@@ -64,11 +127,105 @@ SYNC_RESULT_TIMEOUT_OTHER       = 2     # timeout on another board
 # scale DDS channel analog values from hd5 file to displayed values of channels
 DDS_CHANNEL_SCALING = {DDS_CHANNEL_PROP_FREQ: 1e-6, DDS_CHANNEL_PROP_AMP: 1.0, DDS_CHANNEL_PROP_PHASE: 1.0}
 
+def attach_shared_memory(name, owner=False):
+    # attach to existing shared memory with given name.
+    # the shared memory is unlinked by the primary board which created it and not by the resource tracker of this process.
+    # owner = True if the shared memory was created by this process. then it remains registered with the resource tracker.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 registers attached shared memory with the resource tracker
+        shm = shared_memory.SharedMemory(name=name)
+        if not owner: resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+class h5_shot(object):
+    """
+    decoded data of a shot read from opened h5 file f.
+    device_class = iPCdev class which is used to read the data.
+    all data is cached such that shared datasets are read only once.
+    """
+    def __init__(self, f, device_class):
+        self.f            = f
+        self.device_class = device_class
+        self.cache        = {}
+        self.groups       = {}
+
+    def group(self, path):
+        try:
+            return self.groups[path]
+        except KeyError:
+            group = self.groups[path] = self.f[path]
+            return group
+
+    def stats(self, path):
+        # returns statistics table of board with given path or None. see iPCdev.read_stats.
+        return self.device_class.read_stats(self.group(path), self.cache)
+
+    def times(self, path):
+        # returns times in seconds of IM device or static group with given path
+        return self.device_class.read_times(self.group(path), self.cache)
+
+    def data(self, path, name):
+        # returns decoded data of dataset with given name of IM device or static group with given path or None
+        return self.device_class.read_data(self.group(path), name, self.cache)
+
+class shared_shot(object):
+    """
+    decoded data of a shot published by the primary board in shared memory. see iPCdev_worker.publish_shot.
+    descriptor = dictionary with BROKER_ keys received from primary board.
+    owner      = True if the shared memory was created by this process. see attach_shared_memory.
+    has the same methods as h5_shot. all arrays are read-only views into the shared memory.
+    """
+    def __init__(self, descriptor, owner=False):
+        self.id     = descriptor[BROKER_ID]
+        self.shm    = attach_shared_memory(descriptor[BROKER_NAME], owner)
+        self.arrays = {}
+        for key, (offset, dtype, shape) in descriptor[BROKER_ARRAYS].items():
+            data = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            data.flags.writeable = False
+            self.arrays[key] = data
+        self.arrays.update(descriptor[BROKER_INLINE])
+        self._stats = {}
+
+    def stats(self, path):
+        try:
+            return self._stats[path]
+        except KeyError:
+            table = self.arrays.get((path, DEVICE_STATS))
+            stats = self._stats[path] = None if table is None else {row['name'].decode(): row for row in table}
+            return stats
+
+    def times(self, path):
+        return self.arrays.get((path, DEVICE_TIME))
+
+    def data(self, path, name):
+        return self.arrays.get((path, name))
+
+    def close(self):
+        # release shared memory. when views of the data are still used the memory is released when they are deleted.
+        self.arrays = {}
+        self._stats = {}
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
 class iPCdev_worker(Worker):
 
     # synchronization options. overwrite in derived class
     sync_reset_each_run = SYNC_RESET_EACH_RUN
     sync_time_margin    = SYNC_TIME_MARGIN
+    # if > 0 sync_boards arranges boards in a tree with this maximum number of children per board. must be the same for all boards.
+    sync_tree_fanout    = SYNC_TREE_FANOUT
+
+    # shot cache options. overwrite in derived class
+    shot_cache_memory   = SHOT_CACHE_MEMORY
+    shot_cache_entries  = SHOT_CACHE_ENTRIES
+
+    # if True read_shot reads and unpacks all digital ports into self.ports, also when final values are taken from the statistics table.
+    # set to False when a derived class does not use self.ports. then ports are read only when no statistics are saved. see channel_stats.
+    read_ports          = True
 
     def init(self):
         global zTimeoutError; from zprocess.utils import TimeoutError as zTimeoutError
@@ -95,6 +252,20 @@ class iPCdev_worker(Worker):
                 if self.sync: options.append('synchronize boards')
             except KeyError:
                 self.sync = False
+            # prefetch next shot while current shot is running. disabled by default.
+            # this assumes runmanager names the shot files with a trailing shot number. see next_shot_file.
+            # the prefetched shot is used only when file name, shot id, modification time and size are unchanged.
+            try:
+                self.prefetch = self.worker_args[ARG_PREFETCH]
+                if self.prefetch: options.append('prefetch')
+            except KeyError:
+                self.prefetch = False
+            # primary board reads shot and shares data with secondary boards. must be set for all boards.
+            try:
+                self.broker = self.worker_args[ARG_BROKER]
+                if self.broker: options.append('shot broker')
+            except KeyError:
+                self.broker = False
         if len(options) > 0: options = '(%s)'%(', '.join(options))
         else:                options = ''
 
@@ -133,6 +304,36 @@ class iPCdev_worker(Worker):
         # experiment time in seconds and number of channels for different output types
         self.exp_time = 0
         self.num_channels = {}
+        self.ports = {}
+
+        # prefetch thread and prefetched shot. at most one shot is kept to limit memory.
+        self.prefetch_thread  = None
+        self.prefetch_file    = None
+        self.prefetch_stop    = None
+        self.prefetch_lock    = threading.Lock()
+        self.prefetched       = None
+        # number of guessed next shot files which were (hits) or were not (misses) the next shot and consecutive misses.
+        self.prefetch_hits    = 0
+        self.prefetch_misses  = 0
+        self.prefetch_missed  = 0
+
+        # shot broker: shared memory created by primary board, its descriptor and shot of shared memory which is in use
+        self.broker_shm        = None
+        self.broker_descriptor = None
+        self.broker_shot       = None
+
+        # cache of decoded shots with key = content hash of the shot (see get_shot_key), value = shot dictionary.
+        # shot_key = key of the actual shot or None. shot_cache_hit = True if the actual shot was taken from the cache.
+        # hits and misses count the lookups in the cache and can be used to tune shot_cache_memory and shot_cache_entries.
+        self.shot_cache         = OrderedDict()
+        self.shot_cache_size    = 0
+        self.shot_cache_hits    = 0
+        self.shot_cache_misses  = 0
+        self.shot_key           = None
+        self.shot_cache_hit     = False
+
+        # boards which were late in the last sync_boards
+        self.sync_late = []
 
         # prepare zprocess events for communication between primary and secondary boards
         # primary board: boards/events = list of all secondary board names/events
@@ -140,7 +341,18 @@ class iPCdev_worker(Worker):
         self.create_events()
 
     def create_events(self):
-        if self.is_primary:
+        # with sync_tree_fanout > 0 and many boards each board communicates only with its parent and children.
+        # up events are sent to the parent with EVENT_TO_PRIMARY, down events to the children with EVENT_FROM_PRIMARY.
+        self.tree = self.get_sync_tree()
+        if self.tree is not None:
+            parent, children, subtree, depth, max_depth = self.tree
+            self.events_wait = []
+            self.events_post = []
+            self.tree_events = (self.process_tree.event(EVENT_TO_PRIMARY % self.device_name, role='wait') if len(children) > 0 else None,
+                                self.process_tree.event(EVENT_TO_PRIMARY % parent, role='post') if parent is not None else None,
+                                self.process_tree.event(EVENT_FROM_PRIMARY % self.device_name, role='wait') if parent is not None else None,
+                                [self.process_tree.event(EVENT_FROM_PRIMARY % child, role='post') for child in children])
+        elif self.is_primary:
             self.events_wait = [self.process_tree.event(EVENT_TO_PRIMARY % self.device_name, role='wait')]
             self.events_post = [self.process_tree.event(EVENT_FROM_PRIMARY % s, role='post') for s in self.boards]
         else:
@@ -148,11 +360,12 @@ class iPCdev_worker(Worker):
             self.events_wait = [self.process_tree.event(EVENT_FROM_PRIMARY % self.device_name, role='wait')]
         self.event_count = EVENT_COUNT_INITIAL
 
-    def sync_boards(self, payload=None, timeout=SYNC_TIMEOUT, reset_event_counter=False):
+    def sync_boards(self, payload=None, timeout=SYNC_TIMEOUT, reset_event_counter=False, kind=SYNC_KIND_DEFAULT):
         # synchronize multiple boards
         # payload = data to be distributed to all boards.
         # timeout = timeout time in seconds
         # reset_event_counter = if True resets event counter before waiting.
+        # kind = kind of sync. all boards must give the same kind. events with another kind are discarded.
         # 1. primary board waits for events of all secondary boards and then sends event back.
         # 2. each secondary board sends event to primary board and waits for primary event.
         # primary collects dictionary {board_name:payload} for all boards and sends back to all boards.
@@ -163,6 +376,12 @@ class iPCdev_worker(Worker):
         #            SYNC_RESULT_TIMEOUT_OTHER if connection to any other board timeout
         # result   = if not None dictionary with key = board name, value = payload
         # duration = total time in ms the worker spent in sync_boards function
+        # self.sync_late = list of boards which did not arrive before the deadline. empty if all ok or unknown.
+        # waiting:
+        # all events are waited for until a single deadline = start + timeout in the order they arrive.
+        # so a slow board does not cause a timeout of boards which arrive in time and the late boards are known.
+        # if sync_tree_fanout > 0 the boards are arranged in a tree where each board waits only for its children.
+        # see sync_tree. this reduces the number of events the primary board has to wait for with many boards.
         # timeout behaviour:
         # since each board can be reset by user self.event_count might get out of sync with other boards.
         # this will cause timeout on all boards - event the ones which are still synchronized!
@@ -183,29 +402,26 @@ class iPCdev_worker(Worker):
         t_start = get_ticks()
         if reset_event_counter: self.event_count = EVENT_COUNT_INITIAL
         sync_result = SYNC_RESULT_OK
-        if self.is_primary:
+        self.sync_late = []
+        if self.tree is not None:
+            (sync_result, result) = self.sync_tree(payload, t_start, timeout, reset_event_counter, kind)
+            duration = (get_ticks() - t_start) * 1e3
+        elif self.is_primary:
             # 1. primary board: first wait then send
             if not iPCdev_worker.sync_reset_each_run and reset_event_counter:
                 # compensate the additional waiting time of secondary boards
                 timeout += iPCdev_worker.sync_time_margin
             result = {} if payload is None else {self.device_name:payload}
-            event = self.events_wait[0]
             #sleep(0.1) # this triggers 100% the timeout event! when restarting both secondary boards!
-            for i in range(len(self.boards)):
-                is_timeout = False
-                try:
-                    _t_start = get_ticks()
-                    #self.logger.log(logging.INFO, "%s (pri) wait evt %i (#%i) ..." % (self.device_name, self.event_count, i))
-                    _result = event.wait(self.event_count, timeout=timeout/len(self.boards))
-                    if _result is not None: result.update(_result)
-                except zTimeoutError:
-                    is_timeout = True
-                    sync_result = SYNC_RESULT_TIMEOUT
-                    result[self.boards[i]] = EVENT_TIMEOUT
-                #self.logger.log(logging.WARNING if is_timeout else logging.INFO, "%s (pri) wait evt %i (#%i) %.3fms: %s" % (self.device_name, self.event_count, i, (get_ticks() - _t_start) * 1e3, 'timeout!' if is_timeout else str(_result)))
+            # wait for all secondary boards until the same deadline in the order they arrive
+            self.sync_late = self.wait_boards(self.events_wait[0], kind, self.boards, result, t_start + timeout)
+            if len(self.sync_late) > 0:
+                sync_result = SYNC_RESULT_TIMEOUT
+                for board in self.sync_late:
+                    result[board] = EVENT_TIMEOUT
             if sync_result == SYNC_RESULT_OK:
                 for event in self.events_post:
-                    event.post(self.event_count, data=None if len(result) == 0 else result)
+                    self.post_event(event, kind, None if len(result) == 0 else result)
             else:
                 # on timeout we have to ensure that primary board waits the same time as secondary boards,
                 # otherwise primary board resets and starts waiting too early while other boards are still waiting for first event.
@@ -220,16 +436,15 @@ class iPCdev_worker(Worker):
             if not iPCdev_worker.sync_reset_each_run and reset_event_counter:
                 # ensure primary is reset before sending the reset event id
                 sleep(iPCdev_worker.sync_time_margin)
-            self.events_post[0].post(self.event_count, data={self.device_name:payload})
+            self.post_event(self.events_post[0], kind, {self.device_name:payload})
             is_timeout = False
             try:
                 #self.logger.log(logging.INFO, "%s (sec) wait evt %i ..." % (self.device_name, self.event_count))
-                result = self.events_wait[0].wait(self.event_count, timeout=timeout)
+                result = self.wait_event(self.events_wait[0], kind, get_ticks() + timeout)
                 if (result is not None) and (sync_result == SYNC_RESULT_OK):
-                    for board, _result in result.items():
-                        if isinstance(_result, str) and _result == EVENT_TIMEOUT:
-                            sync_result = SYNC_RESULT_TIMEOUT_OTHER
-                            break
+                    self.sync_late = [board for board, _result in result.items() if isinstance(_result, str) and _result == EVENT_TIMEOUT]
+                    if len(self.sync_late) > 0:
+                        sync_result = SYNC_RESULT_TIMEOUT_OTHER
             except zTimeoutError:
                 is_timeout = True
                 sync_result = SYNC_RESULT_TIMEOUT
@@ -240,6 +455,613 @@ class iPCdev_worker(Worker):
 
         return (sync_result, result, duration)
 
+    def read_shot(self, source):
+        """
+        read and decode all output channels of this board from source.
+        source = h5_shot for an opened h5 file or shared_shot published by the primary board.
+        returns dictionary with keys SHOT_EXP_TIME, SHOT_CHANNELS, SHOT_PORTS and SHOT_FINAL.
+        this is called from transition_to_buffered or from the prefetch thread.
+        the returned data must not be modified since it is shared with the cache.
+        """
+        exp_time = 0
+        num_channels = {}
+        final_values = {}
+        # load data tables for all output channels
+        # source caches already loaded data. shared datasets (hard links) are loaded only once.
+        # static channels are attributes of the board static group which are all loaded with the first channel.
+        # group digital channels by port = (IM device path, dataset) such that each port is read and unpacked once.
+        # ports = dictionary with key = port, value = (port data, {channel name: channel data})
+        #         where channel data is a view into the unpacked bits of the port. see iPCdev.extract_port_data.
+        #         ports are loaded when channel data is needed or when read_ports is True. derived classes can use this to program ports.
+        #         the channel data is read-only and might be shared between channels. see iPCdev.extract_port_data.
+        ports = {}
+        port_channels = {}
+        def read_port(path, dataset):
+            # returns port data or None if not existing. reads and unpacks all channels of port at once.
+            key = (path, dataset)
+            if key not in ports:
+                data = source.data(path, dataset)
+                if data is None: return None
+                names, hardware_infos = zip(*port_channels[key])
+                ports[key] = (data, dict(zip(names, self.device_class_object.extract_port_data(hardware_infos, data))))
+            return ports[key][0]
+        # the statistics table is of the raw data before combine_channel_data. final values are taken from the table
+        # only when extract_channel_data gives the same values, i.e. when the combine and extract functions are not overwritten
+        # in a derived class and analog outputs are not saved as DAC codes. otherwise the final values are extracted from the data.
+        cls = self.device_class_object
+        use_stats = (cls.combine_channel_data is iPCdev.combine_channel_data) and \
+                    (cls.combine_port_data.__func__ is iPCdev.combine_port_data.__func__) and \
+                    (cls.combine_dds_data.__func__ is iPCdev.combine_dds_data.__func__) and \
+                    (cls.extract_channel_data is iPCdev.extract_channel_data) and \
+                    (cls.extract_port_data.__func__ is iPCdev.extract_port_data.__func__)
+        for connection, device in self.channels.items():
+            hardware_info = device.properties[DEVICE_HARDWARE_INFO]
+            if hardware_info[DEVICE_INFO_TYPE][HARDWARE_TYPE] == HARDWARE_TYPE_DO:
+                key = (hardware_info[DEVICE_INFO_PATH], DEVICE_DATA_DO % (hardware_info[DEVICE_INFO_BOARD], hardware_info[DEVICE_INFO_ADDRESS]))
+                try:
+                    port_channels[key].append((device.name, hardware_info))
+                except KeyError:
+                    port_channels[key] = [(device.name, hardware_info)]
+        for connection, device in self.channels.items():
+            hardware_info    = device.properties[DEVICE_HARDWARE_INFO]
+            hardware_type    = hardware_info[DEVICE_INFO_TYPE][HARDWARE_TYPE]
+            hardware_subtype = hardware_info[DEVICE_INFO_TYPE][HARDWARE_SUBTYPE]
+            path = hardware_info[DEVICE_INFO_PATH]
+            # statistics table of board with final values and number of changes. None if not saved or not used.
+            stats = source.stats(path.rsplit(DEVICE_SEP, 1)[0]) if (use_stats and (DEVICE_INFO_SCALE not in hardware_info)) else None
+            times = None
+            static = False
+            if hardware_type == HARDWARE_TYPE_AO:
+                devices = [(device.name, DEVICE_DATA_AO % (device.name, hardware_info[DEVICE_INFO_ADDRESS]),device.parent_port, 'AO', None)]
+                if hardware_subtype == HARDWARE_SUBTYPE_STATIC:
+                    static = True
+            elif (hardware_type == HARDWARE_TYPE_DO): # note: this includes trigger devices as well
+                devices = [(device.name, DEVICE_DATA_DO % (hardware_info[DEVICE_INFO_BOARD], hardware_info[DEVICE_INFO_ADDRESS]), device.parent_port, 'DO', None)]
+                if hardware_subtype == HARDWARE_SUBTYPE_STATIC:
+                    static = True
+            elif hardware_type == HARDWARE_TYPE_DDS:
+                if hardware_subtype == HARDWARE_SUBTYPE_STATIC:
+                    static = True
+                if hardware_info.get(DEVICE_INFO_COMPOUND, False):
+                    # one structured dataset with a field for each sub-channel
+                    dataset = DEVICE_DATA_DDS_COMPOUND % (device.name, hardware_info[DEVICE_INFO_ADDRESS])
+                    devices = [(channel.name, (dataset, channel.parent_port), channel.parent_port, None, DDS_CHANNEL_SCALING[channel.parent_port]) for channel in device.child_list.values()]
+                else:
+                    devices = [(channel.name, DEVICE_DATA_DDS % (device.name, hardware_info[DEVICE_INFO_ADDRESS], channel.parent_port), channel.parent_port, None, DDS_CHANNEL_SCALING[channel.parent_port]) for channel in device.child_list.values()]
+            else:
+                print("warning: device %s unknown type %s (skip)" % (device.name, hardware_type))
+                continue
+            final = {}
+            for (name, dataset, port, type, scaling) in devices:
+                if (stats is not None) and (name in stats):
+                    # final value and changes from statistics table without reading channel data
+                    row = stats[name]
+                    if (type == 'DO') and self.read_ports:
+                        read_port(path, dataset)
+                    if row['end_time'] > exp_time: exp_time = row['end_time']
+                    final_value = bool(row['last']) if (type == 'DO') else row['last']
+                    active = (row['samples'] > 2) and (row['changes'] > 0)
+                else:
+                    # read and decode data saved with encode_changes
+                    if times is None:
+                        times = source.times(path)
+                    channel_data = None
+                    if type == 'DO':
+                        data = read_port(path, dataset)
+                        if data is not None:
+                            channel_data = ports[(path, dataset)][1][name]
+                    elif isinstance(dataset, tuple):
+                        # field of structured dataset. this is a view of the data read once.
+                        data = source.data(path, dataset[0])
+                        if data is not None: data = data[dataset[1]]
+                    else:
+                        data = source.data(path, dataset)
+                    if data is None:
+                        raise LabscriptError("device %s: dataset %s not existing!" % (name, dataset))
+                    elif static and ((len(times) != 2) or (len(data) != 1)):
+                        raise LabscriptError("static device %s: %i/%i times/data instead of 2/1!" % (name, len(times), len(data)))
+                    elif not static and (len(times) != len(data)):
+                        raise LabscriptError("device %s: %i times but %i data!" % (name, len(times), len(data)))
+                    if times[-1] > exp_time: exp_time = times[-1]
+                    if channel_data is None:
+                        channel_data = self.device_class_object.extract_channel_data(hardware_info, data)
+                    final_value = channel_data[-1]
+                    active = (len(channel_data) > 2) and np.any(channel_data[1:] != channel_data[:-1])
+                if scaling is not None:
+                    final[port] = final_value*scaling
+                else:
+                    final[port] = final_value
+                # save number of used channels per type of port.
+                if (type is not None) and active:
+                    try:
+                        num_channels[type] += 1
+                    except KeyError:
+                        num_channels[type] = 1
+
+            if len(devices) == 1: final_values[connection] = final[device.parent_port]
+            else:                 final_values[connection] = final
+
+        return {SHOT_EXP_TIME: exp_time, SHOT_CHANNELS: num_channels, SHOT_PORTS: ports, SHOT_FINAL: final_values}
+
+    def prepare_shot(self, shot):
+        """
+        called from the prefetch thread after the next shot was read with read_shot.
+        hardware which can hold the data of several shots could upload the data here while the current shot is running.
+        notes:
+        - this is executed in a separate thread.
+        - the shot might never be used when the next file was overwritten, the run was aborted or the worker restarted.
+        TODO: overwrite in derived class.
+        """
+        pass
+
+    @staticmethod
+    def get_shot_id(f):
+        # returns unique id of shot from opened h5 file f
+        return f.attrs['sequence_id'] + ('_%i' % f.attrs['sequence_index']) + ('_%i' % f.attrs['run number'])
+
+    @staticmethod
+    def get_shot_stat(h5file):
+        # returns modification time and size of file. used to detect if file was changed after prefetching.
+        stat = os.stat(h5file)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def next_shot_file(h5file):
+        """
+        returns the guessed file name of the next shot or None if cannot be guessed.
+        runmanager appends the shot index (and repetition number) to the file name,
+        so the trailing number of the file name is incremented with the same number of digits.
+        this is only a guess: when the next shot has another name the prefetched shot is not used.
+        the guess is wrong for repeated shots (runmanager '_rep' names), shuffled scans and when shots of another sequence
+        are queued in between. get_prefetched prints the hits and misses and prefetch stops after PREFETCH_MAX_MISSES misses.
+        overwrite in derived class when the name of the next shot is known in another way.
+        """
+        folder, name = os.path.split(h5file)
+        root, ext = os.path.splitext(name)
+        match = re.match(r'^(.*?)(\d+)$', root)
+        if match is None: return None
+        prefix, number = match.groups()
+        return os.path.join(folder, '%s%0*i%s' % (prefix, len(number), int(number) + 1, ext))
+
+    def prefetch_shot(self, h5file, stop):
+        # prefetch thread: waits until h5file exists, reads and decodes shot and calls prepare_shot.
+        # the file is read only when modification time and size did not change within PREFETCH_POLL,
+        # and the shot is discarded when they changed while reading (runmanager might still write the file).
+        # the file is read again until timeout or stop is set.
+        t_end = get_ticks() + PREFETCH_TIMEOUT
+        last = None
+        while not stop.is_set():
+            try:
+                stat = self.get_shot_stat(h5file)
+            except OSError:
+                stat = None
+            if (stat is not None) and (stat == last):
+                try:
+                    with h5py.File(h5file, 'r') as f:
+                        id = self.get_shot_id(f)
+                        shot = self.read_shot(h5_shot(f, self.device_class_object))
+                    if self.get_shot_stat(h5file) == stat:
+                        shot.update({SHOT_ID: id, SHOT_FILE: h5file, SHOT_STAT: stat})
+                        self.prepare_shot(shot)
+                        with self.prefetch_lock:
+                            if not stop.is_set(): self.prefetched = shot
+                        return
+                    stat = None
+                except Exception as e:
+                    self.logger.log(logging.INFO, "%s prefetch '%s' failed: %s" % (self.device_name, h5file, str(e)))
+            last = stat
+            if get_ticks() >= t_end: return
+            stop.wait(PREFETCH_POLL)
+
+    def start_prefetch(self, h5file):
+        # start prefetching of h5file in new thread. any running prefetch is stopped and prefetched shot is discarded.
+        # not started after PREFETCH_MAX_MISSES consecutive misses.
+        self.stop_prefetch()
+        if (h5file is None) or (self.prefetch_missed >= PREFETCH_MAX_MISSES): return
+        self.prefetch_file   = h5file
+        self.prefetch_stop   = threading.Event()
+        self.prefetch_thread = threading.Thread(target=self.prefetch_shot, args=(h5file, self.prefetch_stop), daemon=True)
+        self.prefetch_thread.start()
+
+    def stop_prefetch(self):
+        # stop prefetch thread and discard prefetched shot
+        if self.prefetch_thread is not None:
+            self.prefetch_stop.set()
+            self.prefetch_thread.join()
+            self.prefetch_thread = None
+            self.prefetch_file   = None
+            self.prefetch_stop   = None
+        with self.prefetch_lock:
+            self.prefetched = None
+
+    def get_prefetched(self, h5file, id):
+        """
+        returns prefetched shot if it has the given h5file and id and the file was not changed since prefetching.
+        returns None otherwise. the prefetched shot is removed in any case.
+        when the prefetch thread is still reading h5file we wait for it, otherwise it is stopped.
+        counts a hit or miss when a file was guessed and prints the counts. a wrong guess is a miss,
+        also when the guessed file was not yet existing and was not read.
+        """
+        guessed = self.prefetch_file
+        if self.prefetch_thread is not None:
+            if self.prefetch_thread.is_alive() and (self.prefetch_file == h5file) and os.path.exists(h5file):
+                self.prefetch_thread.join()
+            else:
+                self.prefetch_stop.set()
+                self.prefetch_thread.join()
+            self.prefetch_thread = None
+            self.prefetch_file   = None
+            self.prefetch_stop   = None
+        with self.prefetch_lock:
+            shot = self.prefetched
+            self.prefetched = None
+        if (shot is None) or (shot[SHOT_FILE] != h5file) or (shot[SHOT_ID] != id) or (shot[SHOT_STAT] != self.get_shot_stat(h5file)):
+            shot = None
+        if guessed is not None:
+            if shot is None:
+                self.prefetch_misses += 1
+                self.prefetch_missed += 1
+            else:
+                self.prefetch_hits  += 1
+                self.prefetch_missed = 0
+            print("prefetch: %s '%s' (%i hits, %i misses)%s" % (
+                  'miss' if shot is None else 'hit', os.path.basename(guessed), self.prefetch_hits, self.prefetch_misses,
+                  ', stopped after %i consecutive misses' % self.prefetch_missed if self.prefetch_missed >= PREFETCH_MAX_MISSES else ''))
+        return shot
+
+    @staticmethod
+    def update_digest(digest, value):
+        # update sha1 digest with the content of a numpy array or attribute value
+        data = np.asarray(value)
+        if data.dtype.hasobject:
+            digest.update(repr(value).encode())
+        else:
+            digest.update(repr((data.dtype.str, data.shape)).encode())
+            digest.update(np.ascontiguousarray(data).view(np.uint8))
+
+    @staticmethod
+    def update_dataset_digest(digest, dataset):
+        # update sha1 digest with the stored bytes of dataset. chunks are hashed as stored without decompressing them,
+        # together with the filters. datasets with variable-length data store heap references and are read.
+        if (dataset.chunks is None) or dataset.dtype.hasobject:
+            iPCdev_worker.update_digest(digest, dataset[()])
+            return
+        digest.update(repr((dataset.chunks, dataset.compression, dataset.compression_opts, dataset.shuffle)).encode())
+        for index in range(dataset.id.get_num_chunks()):
+            info = dataset.id.get_chunk_info(index)
+            digest.update(repr((info.chunk_offset, info.filter_mask)).encode())
+            digest.update(dataset.id.read_direct_chunk(info.chunk_offset)[1])
+
+    def get_shot_key(self, f):
+        """
+        returns hex digest of the content of all groups of opened h5 file f which contain channels of this board.
+        the digest includes the attributes of the groups and the name, type, shape and attributes of all datasets.
+        for the content of the datasets the DEVICE_HASH attribute saved by iPCdev.save_data is used if existing.
+        otherwise the stored bytes are hashed with update_dataset_digest, i.e. when iPCdev.deduplicate is False,
+        for datasets saved as loops or segments and for files compiled with an older version.
+        shots with the same key decode to the same data.
+        """
+        digest = sha1()
+        paths = sorted(set([device.properties[DEVICE_HARDWARE_INFO][DEVICE_INFO_PATH] for device in self.channels.values()]))
+        for path in paths:
+            group = f[path]
+            digest.update(path.encode())
+            for name in sorted(group.attrs.keys()):
+                digest.update(name.encode())
+                self.update_digest(digest, group.attrs[name])
+            for name in sorted(group.keys()):
+                dataset = group[name]
+                if not isinstance(dataset, h5py.Dataset): continue
+                digest.update(repr((name, dataset.dtype.str, dataset.shape)).encode())
+                attrs = dict(dataset.attrs)
+                content = attrs.pop(DEVICE_HASH, None)
+                if content is None:
+                    self.update_dataset_digest(digest, dataset)
+                else:
+                    digest.update(str(content).encode())
+                for attr in sorted(attrs.keys()):
+                    digest.update(attr.encode())
+                    self.update_digest(digest, attrs[attr])
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_shot_size(shot):
+        # returns number of bytes of the port data and of the unpacked channel data of shot.
+        # channel data are views of one array per port which is counted once.
+        size = 0
+        bases = set()
+        for data, channels in shot[SHOT_PORTS].values():
+            for array in [data] + list(channels.values()):
+                while isinstance(array.base, np.ndarray): array = array.base
+                if id(array) not in bases:
+                    bases.add(id(array))
+                    size += array.nbytes
+        return size
+
+    def get_cached_shot(self, key):
+        # returns shot with given key from cache and marks it as most recently used. returns None if not in cache.
+        try:
+            shot = self.shot_cache[key]
+        except KeyError:
+            self.shot_cache_misses += 1
+            return None
+        self.shot_cache.move_to_end(key)
+        self.shot_cache_hits += 1
+        return shot
+
+    def cache_shot(self, key, shot):
+        # add shot with given key to cache. removes least recently used shots when cache is full.
+        if (self.shot_cache_memory <= 0) or (key in self.shot_cache): return
+        shot[SHOT_KEY]  = key
+        shot[SHOT_SIZE] = self.get_shot_size(shot)
+        if shot[SHOT_SIZE] > self.shot_cache_memory: return
+        self.shot_cache[key] = shot
+        self.shot_cache_size += shot[SHOT_SIZE]
+        while (self.shot_cache_size > self.shot_cache_memory) or (len(self.shot_cache) > self.shot_cache_entries):
+            _key, _shot = self.shot_cache.popitem(last=False)
+            self.shot_cache_size -= _shot[SHOT_SIZE]
+            self.evict_shot(_key, _shot)
+
+    def clear_shot_cache(self):
+        # remove all shots from cache
+        while len(self.shot_cache) > 0:
+            key, shot = self.shot_cache.popitem(last=False)
+            self.evict_shot(key, shot)
+        self.shot_cache_size = 0
+
+    def evict_shot(self, key, shot):
+        """
+        called when shot with given key is removed from the shot cache.
+        derived classes which keep the data of cached shots on the hardware can free the buffers here.
+        on a cache hit self.shot_cache_hit is True and self.shot_key is the key of the shot
+        which allows to reuse the buffers on the hardware instead of uploading the data again.
+        TODO: overwrite in derived class.
+        """
+        pass
+
+    def publish_shot(self, f, shot_id):
+        """
+        primary board with shot broker: read and decode the data of all boards from opened h5 file f
+        and copy it into a new shared memory. returns descriptor which is sent to the secondary boards.
+        the shared memory of the previous shot is unlinked. secondary boards have attached to it already.
+        """
+        source = h5_shot(f, self.device_class_object)
+        arrays = {}
+        for board in [self.device_name] + self.boards:
+            board_path = DEVICE_DEVICES + DEVICE_SEP + board
+            if board_path not in f: continue
+            g_board = f[board_path]
+            if DEVICE_STATS in g_board:
+                arrays[(board_path, DEVICE_STATS)] = g_board[DEVICE_STATS][()]
+            for name, group in g_board.items():
+                if not isinstance(group, h5py.Group): continue
+                path = board_path + DEVICE_SEP + name
+                if name == DEVICE_STATIC:
+                    for attr in group.attrs.keys():
+                        arrays[(path, attr)] = source.data(path, attr)
+                elif DEVICE_TIME in group:
+                    for dataset, obj in group.items():
+                        if (dataset != DEVICE_TIME) and isinstance(obj, h5py.Dataset):
+                            arrays[(path, dataset)] = source.data(path, dataset)
+                else:
+                    continue
+                arrays[(path, DEVICE_TIME)] = source.times(path)
+        # layout of shared memory. shared datasets are decoded into the same array and are copied only once.
+        layout = {}
+        offsets = {}
+        inline = {}
+        size = 0
+        for key, data in arrays.items():
+            if data is None: continue
+            data = np.ascontiguousarray(data)
+            if data.dtype.hasobject:
+                inline[key] = data
+                continue
+            arrays[key] = data
+            try:
+                offset = offsets[id(data)]
+            except KeyError:
+                offset = offsets[id(data)] = size
+                size += ((data.nbytes + BROKER_ALIGN - 1) // BROKER_ALIGN) * BROKER_ALIGN
+            layout[key] = (offset, data.dtype, data.shape)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for key, (offset, dtype, shape) in layout.items():
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = arrays[key]
+        # unlink shared memory of previous shot
+        self.release_broker(shot=False)
+        self.broker_shm = shm
+        self.broker_descriptor = {BROKER_NAME: shm.name, BROKER_ID: shot_id, BROKER_ARRAYS: layout, BROKER_INLINE: inline}
+        return self.broker_descriptor
+
+    def exchange_shot(self, h5file):
+        """
+        shot broker: the primary board reads h5file once and publishes the decoded data of all boards with publish_shot.
+        the descriptor is sent with sync_boards to the secondary boards which attach to the shared memory.
+        returns shared_shot or None on error. then each board should read h5file itself.
+        when the same file is run again the primary board sends the descriptor of the published shot again without publishing
+        and each board which has this shot in use (self.broker_shot) returns it without attaching again.
+        notes:
+        - this must be called by all boards, otherwise the boards wait until BROKER_TIMEOUT.
+          all boards call sync_boards, also when they reuse their shot, such that a restarted board without shot in use
+          gets the descriptor and all boards stay in step for the following sync_boards.
+        - all boards open the h5 file but the secondary boards read only the shot id.
+        """
+        shot_id = None
+        descriptor = None
+        try:
+            with h5py.File(h5file, 'r') as f:
+                shot_id = self.get_shot_id(f)
+                if self.is_primary:
+                    if (self.broker_descriptor is not None) and (self.broker_descriptor[BROKER_ID] == shot_id):
+                        descriptor = self.broker_descriptor
+                    else:
+                        descriptor = self.publish_shot(f, shot_id)
+        except Exception as e:
+            # secondary boards get no descriptor and read the file themselves
+            print("%s shot broker: publish '%s' failed: %s" % (self.device_name, h5file, str(e)))
+        (timeout, result, duration) = self.sync_boards(payload=descriptor, timeout=BROKER_TIMEOUT, reset_event_counter=SYNC_RESET_EACH_RUN, kind=SYNC_KIND_BROKER)
+        if timeout != SYNC_RESULT_OK:
+            print("%s shot broker: timeout (%.3fms), read file" % (self.device_name, duration))
+            return None
+        if not self.is_primary:
+            descriptor = None if result is None else result.get(self.boards[0], None)
+        if descriptor is None:
+            return None
+        if descriptor[BROKER_ID] != shot_id:
+            print("%s shot broker: shot id %s of primary board differs from '%s', read file" % (self.device_name, str(descriptor[BROKER_ID]), h5file))
+            return None
+        if (self.broker_shot is not None) and (self.broker_shot.id == shot_id):
+            print('%s shot broker: reuse %i arrays (%.3fms)' % (self.device_name, len(self.broker_shot.arrays), duration))
+            return self.broker_shot
+        try:
+            source = shared_shot(descriptor, owner=self.is_primary)
+        except Exception as e:
+            print("%s shot broker: attach shared memory failed: %s" % (self.device_name, str(e)))
+            return None
+        print('%s shot broker: %i arrays (%.3fms)' % (self.device_name, len(source.arrays), duration))
+        return source
+
+    def release_broker(self, shot=True):
+        # unlink shared memory created by primary board.
+        # if shot is True release also the shared memory of the shot in use.
+        if self.broker_shm is not None:
+            self.broker_shm.close()
+            self.broker_shm.unlink()
+            self.broker_shm = None
+            self.broker_descriptor = None
+        if shot and (self.broker_shot is not None):
+            self.broker_shot.close()
+            self.broker_shot = None
+
+    def get_sync_tree(self):
+        """
+        returns (parent, children, subtree, depth, max_depth) of this board in the tree used by sync_boards or None if not used.
+        parent    = name of parent board or None for the primary board which is the root of the tree.
+        children  = list of names of child boards. each board has up to sync_tree_fanout children.
+        subtree   = list of names of all boards below this board, i.e. the children, their children, etc.
+        depth     = depth of this board. 0 for primary board.
+        max_depth = maximum depth of all boards.
+        the tree is built from the 'all_boards' property which has the same order for all boards.
+        returns None if sync_tree_fanout <= 0, if the property is missing or if the primary board has all boards as children.
+        """
+        fanout = self.sync_tree_fanout
+        boards = self.properties['all_boards'] if 'all_boards' in self.properties else None
+        if (fanout <= 0) or (boards is None) or (self.device_name not in boards) or (len(boards) <= fanout + 1):
+            return None
+        def get_depth(index):
+            depth = 0
+            while index > 0:
+                index = (index - 1) // fanout
+                depth += 1
+            return depth
+        index    = list(boards).index(self.device_name)
+        parent   = None if index == 0 else boards[(index - 1) // fanout]
+        children = list(boards[fanout*index + 1 : fanout*index + fanout + 1])
+        subtree  = []
+        first, last = index, index
+        while True:
+            first, last = fanout*first + 1, min(fanout*last + fanout, len(boards) - 1)
+            if first > last: break
+            subtree.extend(boards[first : last + 1])
+        return (parent, children, subtree, get_depth(index), get_depth(len(boards) - 1))
+
+    def get_late_boards(self):
+        # returns string with boards which were late in the last sync_boards or empty string if not known
+        if len(self.sync_late) == 0: return ''
+        return '\nlate boards: %s' % (', '.join(self.sync_late))
+
+    def post_event(self, event, kind, data):
+        # post data with given kind of sync and self.event_count
+        event.post(self.event_count, data={EVENT_KIND: kind, EVENT_DATA: data})
+
+    def wait_event(self, event, kind, deadline):
+        """
+        waits for event with self.event_count and given kind of sync until deadline = absolute time in seconds from get_ticks.
+        events with another kind are discarded and waiting continues until the deadline.
+        returns data of the event. raises zTimeoutError when no event of this kind arrived before the deadline.
+        """
+        while True:
+            _data = event.wait(self.event_count, timeout=max(deadline - get_ticks(), 0))
+            if isinstance(_data, dict) and (_data.get(EVENT_KIND, None) == kind):
+                return _data[EVENT_DATA]
+            print('%s sync %s: discard event of kind %s' % (self.device_name, kind, str(_data.get(EVENT_KIND, None)) if isinstance(_data, dict) else 'unknown'))
+            if get_ticks() >= deadline:
+                raise zTimeoutError('%s sync %s: timeout' % (self.device_name, kind))
+
+    def wait_boards(self, event, kind, boards, result, deadline, forward=None):
+        """
+        waits for events of the given kind of sync of the given boards until deadline = absolute time in seconds from get_ticks.
+        the events are taken in the order they arrive. each event data is a dictionary which is added to result
+        and which contains the name of the board which has sent it. events with another kind are discarded.
+        if forward is not None each event data is posted with forward as soon as it arrives.
+        returns list of boards which did not arrive before the deadline.
+        """
+        pending = set(boards)
+        while len(pending) > 0:
+            remaining = deadline - get_ticks()
+            if remaining <= 0: break
+            try:
+                _result = self.wait_event(event, kind, deadline)
+            except zTimeoutError:
+                break
+            if _result is not None:
+                result.update(_result)
+                pending.difference_update(_result.keys())
+                if forward is not None:
+                    self.post_event(forward, kind, _result)
+        return [board for board in boards if board in pending]
+
+    def sync_tree(self, payload, t_start, timeout, reset_event_counter, kind):
+        """
+        sync_boards with boards arranged in a tree. see get_sync_tree. returns (status, result).
+        1. each board sends its payload to its parent and forwards the events of its subtree to its parent as they arrive.
+           so the primary board gets the payload of each board as soon as the board arrives, independent of the time
+           the boards in between have called sync_boards. the primary board marks the boards which did not arrive
+           before its deadline with EVENT_TIMEOUT in the result.
+        2. the primary board sends the result of all boards to its children which forward it to their children.
+           on timeout the primary board does not send the result and waits until the timeout like in sync_boards.
+        notes:
+        - all boards wait until the same deadline = t_start + timeout as in sync_boards.
+          a board cannot forward events after its deadline but then this board is timeout as well.
+        - boards below a board which is late are marked as late as well since their events cannot be forwarded.
+        - the primary board gets up to one event per board but only from its children.
+        - events with another kind than the given kind of sync are discarded by wait_event, also when forwarding.
+        """
+        parent, children, subtree, depth, max_depth = self.tree
+        up_wait, up_post, down_wait, down_post = self.tree_events
+        sync_result = SYNC_RESULT_OK
+        if not iPCdev_worker.sync_reset_each_run and reset_event_counter:
+            if parent is None: timeout += iPCdev_worker.sync_time_margin
+            else:              sleep(iPCdev_worker.sync_time_margin)
+        deadline = t_start + timeout
+        if parent is None:
+            result = {} if payload is None else {self.device_name:payload}
+            self.sync_late = self.wait_boards(up_wait, kind, subtree, result, deadline)
+            if len(self.sync_late) > 0:
+                sync_result = SYNC_RESULT_TIMEOUT
+                for board in self.sync_late:
+                    result[board] = EVENT_TIMEOUT
+                remaining = deadline - get_ticks()
+                if remaining > 0: sleep(remaining)
+            else:
+                for event in down_post:
+                    self.post_event(event, kind, None if len(result) == 0 else result)
+        else:
+            self.post_event(up_post, kind, {self.device_name:payload})
+            if len(subtree) > 0:
+                self.wait_boards(up_wait, kind, subtree, {}, deadline, forward=up_post)
+            try:
+                result = self.wait_event(down_wait, kind, deadline)
+            except zTimeoutError:
+                return (SYNC_RESULT_TIMEOUT, None)
+            for event in down_post:
+                self.post_event(event, kind, result)
+            if result is not None:
+                self.sync_late = [board for board, _result in result.items() if isinstance(_result, str) and _result == EVENT_TIMEOUT]
+                if len(self.sync_late) > 0:
+                    sync_result = SYNC_RESULT_TIMEOUT_OTHER
+        return (sync_result, result)
+
     def program_manual(self, front_panel_values):
         print(self.device_name, 'program manual')
         return {}
@@ -252,73 +1074,71 @@ class iPCdev_worker(Worker):
         final_values = {}
         update = fresh # requires supports_smart_programming=True and fresh=True when 'clear smart-programming cache' symbol clicked
 
-        with h5py.File(h5file,'r') as f:
-            # file id used to check if file has been changed
-            id = f.attrs['sequence_id'] + ('_%i' % f.attrs['sequence_index']) + ('_%i' % f.attrs['run number'])
-            if update or (self.file_id is None) or (self.file_id != id):
+        shot = None
+        prefetched = False
+        self.shot_key = None
+        self.shot_cache_hit = False
+        # with shot broker the primary board reads the file and secondary boards get the data from shared memory.
+        # source is None when the broker is not used or failed. then each board reads the file.
+        source = self.exchange_shot(h5file) if (self.broker and (len(self.boards) > 0)) else None
+        if source is not None:
+            if update or (self.file_id is None) or (self.file_id != source.id):
                 # new file
-                self.file_id = id
-                self.exp_time = 0
-                self.num_channels = {}
+                self.file_id = source.id
                 update = True
+                shot = self.read_shot(source)
+        else:
+            with h5py.File(h5file,'r') as f:
+                # file id used to check if file has been changed
+                id = self.get_shot_id(f)
+                if update or (self.file_id is None) or (self.file_id != id):
+                    # new file
+                    self.file_id = id
+                    update = True
 
-                # load data tables for all output channels
-                for connection, device in self.channels.items():
-                    hardware_info    = device.properties[DEVICE_HARDWARE_INFO]
-                    hardware_type    = hardware_info[DEVICE_INFO_TYPE][HARDWARE_TYPE]
-                    hardware_subtype = hardware_info[DEVICE_INFO_TYPE][HARDWARE_SUBTYPE]
-                    group = f[hardware_info[DEVICE_INFO_PATH]]
-                    times = group[DEVICE_TIME][()]
-                    static = False
-                    if hardware_type == HARDWARE_TYPE_AO:
-                        devices = [(device.name, DEVICE_DATA_AO % (device.name, hardware_info[DEVICE_INFO_ADDRESS]),device.parent_port, 'AO', None)]
-                        if hardware_subtype == HARDWARE_SUBTYPE_STATIC:
-                            static = True
-                    elif (hardware_type == HARDWARE_TYPE_DO): # note: this includes trigger devices as well
-                        devices = [(device.name, DEVICE_DATA_DO % (hardware_info[DEVICE_INFO_BOARD], hardware_info[DEVICE_INFO_ADDRESS]), device.parent_port, 'DO', None)]
-                        if hardware_subtype == HARDWARE_SUBTYPE_STATIC:
-                            static = True
-                    elif hardware_type == HARDWARE_TYPE_DDS:
-                        if hardware_subtype == HARDWARE_SUBTYPE_STATIC:
-                            static = True
-                        devices = [(channel.name, DEVICE_DATA_DDS % (device.name, hardware_info[DEVICE_INFO_ADDRESS], channel.parent_port), channel.parent_port, None, DDS_CHANNEL_SCALING[channel.parent_port]) for channel in device.child_list.values()]
-                    else:
-                        print("warning: device %s unknown type %s (skip)" % (device.name, hardware_type))
-                        continue
-                    final = {}
-                    for (name, dataset, port, type, scaling) in devices:
-                        data = group[dataset][()]
-                        if data is None:
-                            raise LabscriptError("device %s: dataset %s not existing!" % (name, dataset))
-                        elif static and ((len(times) != 2) or (len(data) != 1)):
-                            raise LabscriptError("static device %s: %i/%i times/data instead of 2/1!" % (name, len(times), len(data)))
-                        elif not static and (len(times) != len(data)):
-                            raise LabscriptError("device %s: %i times but %i data!" % (name, len(times), len(data)))
-                        if times[-1] > self.exp_time: self.exp_time = times[-1]
-                        channel_data = self.device_class_object.extract_channel_data(hardware_info, data)
-                        if scaling is not None:
-                            final[port] = channel_data[-1]*scaling
-                        else:
-                            final[port] = channel_data[-1]
-                        # save number of used channels per type of port.
-                        if (type is not None) and (len(channel_data) > 2):
-                            changes = ((channel_data[1:].astype(int) - channel_data[:-1].astype(int)) != 0)
-                            if np.any(changes):
-                                try:
-                                    self.num_channels[type] += 1
-                                except KeyError:
-                                    self.num_channels[type] = 1
-
-                    if len(devices) == 1: final_values[connection] = final[device.parent_port]
-                    else:                 final_values[connection] = final
-
-                print('final values:', final_values)
+                    # take prefetched shot if available, otherwise take shot with same content from the shot cache
+                    # or read shot now. when fresh = True the user requested to reload the file
+                    # and the prefetched and all cached shots are discarded.
+                    if fresh:
+                        self.clear_shot_cache()
+                        self.prefetch_missed = 0
+                    elif self.prefetch:
+                        shot = self.get_prefetched(h5file, id)
+                        prefetched = shot is not None
+                    if self.shot_cache_memory > 0:
+                        self.shot_key = self.get_shot_key(f)
+                        if shot is None:
+                            shot = self.get_cached_shot(self.shot_key)
+                            self.shot_cache_hit = shot is not None
+                    if shot is None:
+                        self.stop_prefetch()
+                        shot = self.read_shot(h5_shot(f, self.device_class_object))
+                    if self.shot_cache_memory > 0:
+                        self.cache_shot(self.shot_key, shot)
+                        print('shot cache: %s (%i hits, %i misses, %i shots, %.1f MB)' % (
+                              'hit' if self.shot_cache_hit else 'miss', self.shot_cache_hits, self.shot_cache_misses,
+                              len(self.shot_cache), self.shot_cache_size/(1024*1024)))
+
+        if shot is not None:
+            self.exp_time     = shot[SHOT_EXP_TIME]
+            self.num_channels = shot[SHOT_CHANNELS]
+            self.ports        = shot[SHOT_PORTS]
+            final_values      = dict(shot[SHOT_FINAL])
+
+            print('final values:', final_values)
+
+        if (source is not None) and (source is not self.broker_shot):
+            # keep shared memory of shot in use and release the previous or unused one
+            if shot is not None:
+                source, self.broker_shot = self.broker_shot, source
+            if source is not None:
+                source.close()
 
         if   self.exp_time >= 1.0: tmp = '%.3f s'  % (self.exp_time)
         elif self.exp_time > 1e-3: tmp = '%.3f ms' % (self.exp_time*1e3)
         elif self.exp_time > 1e-6: tmp = '%.3f us' % (self.exp_time*1e6)
         else:                      tmp = '%.1f ns' % (self.exp_time*1e9)
-        print('\n%s start experiment: duration %s %s' % (self.device_name, tmp, '(old file)' if not update else '(new file)'))
+        print('\n%s start experiment: duration %s %s' % (self.device_name, tmp, '(old file)' if not update else ('(new file, prefetched)' if prefetched else '(new file)')))
 
         #print('final values:', final_values)
 
@@ -329,16 +1149,16 @@ class iPCdev_worker(Worker):
             #       if a board is restarted we will get timeout but we can restart all boards and try again.
             count = 0
             payload = np.round(self.exp_time,6)
-            (timeout, board_times, duration) = self.sync_boards(payload=payload, reset_event_counter=SYNC_RESET_EACH_RUN)
+            (timeout, board_times, duration) = self.sync_boards(payload=payload, reset_event_counter=SYNC_RESET_EACH_RUN, kind=SYNC_KIND_TIME)
             while timeout != SYNC_RESULT_OK:
                 if timeout == SYNC_RESULT_TIMEOUT:         tmp = ''
                 elif timeout == SYNC_RESULT_TIMEOUT_OTHER: tmp = '(other) '
                 else:                                      tmp = '(unknown) '
                 if not iPCdev_worker.sync_reset_each_run and (count < 1):
-                    print("\ntimeout %ssync with all boards! (%.3fms, reset & retry)\n" % (tmp, duration))
-                    (timeout, board_times, duration) = self.sync_boards(payload=payload, reset_event_counter=True)
+                    print("\ntimeout %ssync with all boards! (%.3fms, reset & retry)%s\n" % (tmp, duration, self.get_late_boards()))
+                    (timeout, board_times, duration) = self.sync_boards(payload=payload, reset_event_counter=True, kind=SYNC_KIND_TIME)
                 else:
-                    print("\ntimeout %ssync with all boards! (%.3fms, abort)\n" % (tmp, duration))
+                    print("\ntimeout %ssync with all boards! (%.3fms, abort)%s\n" % (tmp, duration, self.get_late_boards()))
                     return None
                 count += 1
             print('board times (%.3fms):'%duration, board_times)
@@ -350,6 +1170,10 @@ class iPCdev_worker(Worker):
                         print('%s update duration from board %s to %.3e s' % (self.device_name, board,exp_time))
                         self.exp_time = exp_time
 
+        # prefetch next shot while this shot is running
+        if self.prefetch and not (self.broker and (len(self.boards) > 0)):
+            self.start_prefetch(self.next_shot_file(h5file))
+
         # manually call start_run from here
         self.start_run()
 
@@ -362,6 +1186,8 @@ class iPCdev_worker(Worker):
         error = 0
 
         if abort:
+            # discard prefetched shot. the next shot might be recompiled or not be the guessed one.
+            if self.prefetch: self.stop_prefetch()
             self.board_status = {}
             print('board status: ABORTED!')
         else:
@@ -374,14 +1200,14 @@ class iPCdev_worker(Worker):
 
             if self.sync:
                 # get status (error) of all boards
-                (timeout, self.board_status, duration) = self.sync_boards(payload=error)
+                (timeout, self.board_status, duration) = self.sync_boards(payload=error, kind=SYNC_KIND_STATUS)
                 if timeout == SYNC_RESULT_OK:
                     print('board status (%.3fms):'%duration, self.board_status)
                 else:
                     if   timeout == SYNC_RESULT_TIMEOUT:       tmp = ''
                     elif timeout == SYNC_RESULT_TIMEOUT_OTHER: tmp = '(other) '
                     else:                                      tmp = '(unknown) '
-                    print("\ntimeout %sget status of all boards! (%.3fms)\n" % (tmp, duration))
+                    print("\ntimeout %sget status of all boards! (%.3fms)%s\n" % (tmp, duration, self.get_late_boards()))
                     return True
                 print('board status (%.3fms):'%duration, self.board_status)
             else:
@@ -444,6 +1270,9 @@ class iPCdev_worker(Worker):
     def restart(self):
         # restart tab only. return True = restart, False = do not restart.
         print(self.device_name, 'restart')
+        self.stop_prefetch()
+        self.release_broker()
+        self.clear_shot_cache()
         # TODO: cleanup resources here
         # short sleep to allow user to read that we have cleaned up.
         sleep(0.5)
@@ -452,6 +1281,9 @@ class iPCdev_worker(Worker):
     def shutdown(self):
         # shutdown blacs
         print(self.device_name, 'shutdown')
+        self.stop_prefetch()
+        self.release_broker()
+        self.clear_shot_cache()
         # TODO: cleanup resources here...
         # short sleep to allow user to read that we have cleaned up.
         sleep(0.5)
@@ -19,6 +19,12 @@ from labscript import (
 
 import numpy as np
 from time import perf_counter as get_ticks
+from hashlib import sha1
+import tracemalloc
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import h5py
 
 # reduce number of log entries in logfile (labscript-suite/logs/BLACS.log)
 import logging
@@ -40,6 +46,8 @@ NAME_STATIC_AO          = 'ao_static'
 NAME_STATIC_DO          = 'do_static'
 NAME_DDS                = 'dds'
 NAME_VIRTUAL            = 'virtual'
+# clockline part of connection of AO bank with consolidated clockline. see iPCdev.AO_consolidate.
+NAME_AO_BANK            = 'bank%i'
 # pseudoclock, clockline and device name format strings for given clockline name
 # NAME_DEV is displayed in runviwer_parser to user for the clockline. others are not visible to user.
 NAME_PS                 = '%s_ps'
@@ -82,6 +90,93 @@ DEVICE_TIME             = 'time'
 DEVICE_DATA_AO          = 'data_ao_%s_%x'       # name + address
 DEVICE_DATA_DO          = 'data_do_%s_%x'       # board name + address
 DEVICE_DATA_DDS         = 'data_dds_%s_%s_%s'   # name + address + sub-channel name
+DEVICE_DATA_DDS_COMPOUND= 'data_dds_%s_%s'      # name + address. structured data with one field per sub-channel. see iPCdev.DDS_compound.
+# board sub-group for static channels. instead of datasets the values are saved as attributes with the dataset names above.
+# the static clockline times are saved as attribute DEVICE_TIME. see iPCdev.save_static_data and iPCdev.read_static.
+DEVICE_STATIC           = 'static'
+
+# dataset attribute giving the encoding of channel data. if not present data is saved for each time.
+DEVICE_ENCODING         = 'encoding'
+# encoding with (index, value) records for each change of value. see iPCdev.encode_changes.
+ENCODING_CHANGES        = 'changes'
+ENCODING_INDEX          = 'index'
+ENCODING_VALUE          = 'value'
+# encoding of analog outputs as piecewise-linear segments with (t_start, t_end, v_start, v_end) records.
+# times are in seconds. see iPCdev.AO_segments, iPCdev.get_segments and iPCdev.expand_segments.
+ENCODING_SEGMENTS       = 'segments'
+SEGMENTS_DTYPE          = [('t_start', np.float64), ('t_end', np.float64), ('v_start', np.float64), ('v_end', np.float64)]
+# encoding of periodic blocks of a clockline. the dataset contains the compressed samples
+# and the DEVICE_LOOPS attribute the records (offset, length, repeats): samples[offset:offset+length] are repeated repeats times.
+# if the DEVICE_DELTA attribute is True the samples are differences of times. see iPCdev.loop_compression.
+ENCODING_LOOPS          = 'loops'
+DEVICE_LOOPS            = 'loops'
+DEVICE_DELTA            = 'delta'
+LOOPS_DTYPE             = [('offset', np.int64), ('length', np.int64), ('repeats', np.int64)]
+LOOPS_MAX_RECORDS       = 2048      # 2048 records of 24 bytes fit into the maximum size of HDF5 attributes of 64kB
+LOOPS_MAX_CANDIDATES    = 4096      # maximum number of candidate blocks of get_loops with the largest savings
+
+# per-channel statistics table saved in board group. see iPCdev.channel_stats.
+# one row for each channel (for DDS for each sub-channel) with data on the clocklines of the board:
+# channel name, number of samples and changes, first, last, minimum and maximum value,
+# time of last change (time of first sample without changes) and time of last sample of clockline.
+DEVICE_STATS            = 'stats'
+# the name is a variable-length UTF-8 string which h5py reads as bytes. see iPCdev.read_stats.
+STATS_DTYPE             = [('name', h5py.string_dtype()), ('samples', np.int64), ('changes', np.int64),
+                           ('first', np.float64), ('last', np.float64), ('min', np.float64), ('max', np.float64),
+                           ('last_change', np.float64), ('end_time', np.float64)]
+
+# time dataset attribute with clock resolution in seconds when times are saved as integer ticks. see iPCdev.time_ticks.
+DEVICE_RESOLUTION       = 'resolution'
+
+# dataset attribute with hex digest of the saved data. datasets with same content are saved once and hard linked.
+DEVICE_HASH             = 'hash'
+
+# storage policy entries. see iPCdev.storage_policy and iPCdev.get_storage_options.
+STORAGE_CHUNKS          = 'chunks'              # chunk size in number of elements
+STORAGE_SHUFFLE         = 'shuffle'             # if True use shuffle filter
+STORAGE_COMPRESSION     = 'compression'         # compression filter like 'gzip' or 'lzf'
+STORAGE_LEVEL           = 'compression_opts'    # compression level for 'gzip' 0-9
+STORAGE_ADAPTIVE        = 'adaptive'            # storage_policy for adaptive selection per dataset
+# adaptive storage policy:
+# datasets below STORAGE_MIN_BYTES are saved contiguous without compression.
+# datasets with fraction of changes below STORAGE_SPARSE are saved with STORAGE_POLICY_SPARSE, otherwise with STORAGE_POLICY_DENSE.
+STORAGE_MIN_BYTES       = 4096
+STORAGE_SPARSE          = 0.01
+STORAGE_POLICY_SPARSE   = {STORAGE_CHUNKS: 1<<18, STORAGE_SHUFFLE: True, STORAGE_COMPRESSION: 'gzip', STORAGE_LEVEL: 9}
+STORAGE_POLICY_DENSE    = {STORAGE_CHUNKS: 1<<16, STORAGE_SHUFFLE: True, STORAGE_COMPRESSION: 'gzip', STORAGE_LEVEL: 1}
+
+# streaming mode: estimated bytes of temporary arrays per sample and minimum number of samples per chunk.
+# see iPCdev.stream_memory_limit.
+STREAM_BYTES_PER_SAMPLE = 64
+STREAM_MIN_SAMPLES      = 1024
+
+# parallel compression: maximum bytes of data of datasets with chunks not yet written when stream_memory_limit is None.
+# see iPCdev.compress_workers.
+COMPRESS_PENDING_BYTES  = 64*1024*1024
+
+# compile profiling table saved in board group. see iPCdev.profile_compile.
+DEVICE_PROFILE          = 'profile'
+# the name of the board, IM device or dataset is a variable-length UTF-8 string which h5py reads as bytes.
+PROFILE_DTYPE           = [('stage', 'S16'), ('name', h5py.string_dtype()), ('duration_ms', np.float64), ('peak_bytes', np.int64)]
+PROFILE_CLOCK           = 'clock'       # PseudoclockDevice.generate_code. for primary board includes secondary boards.
+PROFILE_PREPARE         = 'prepare'     # prepare_generate_code
+PROFILE_COMBINE         = 'combine'     # combine data of dataset
+PROFILE_WRITE           = 'write'       # save dataset into file
+PROFILE_STREAM          = 'stream'      # combine and save dataset in streaming mode
+PROFILE_TOTAL           = 'total'       # generate_code
+PROFILE_CACHE           = 'cache'       # dataset copied from compile cache
+PROFILE_LOOPS           = 'loops'       # detect loops of clockline. see iPCdev.loop_compression.
+PROFILE_FLUSH           = 'flush'       # write chunks compressed in parallel. see iPCdev.compress_workers.
+
+# compile cache folder created in the folder of the shot files. see iPCdev.compile_cache_size.
+# each board saves the new entries of a shot into one file COMPILE_CACHE_FILE with one dataset per entry named by its key.
+# increment COMPILE_CACHE_VERSION when the saved data changes for the same channel data.
+COMPILE_CACHE_FOLDER    = '.iPCdev_cache'
+COMPILE_CACHE_FILE      = '%s.h5'
+COMPILE_CACHE_VERSION   = 2
+# board group attributes with number of cache hits and misses
+DEVICE_CACHE_HITS       = 'cache_hits'
+DEVICE_CACHE_MISSES     = 'cache_misses'
 
 # hardware info entry in connection table property
 DEVICE_HARDWARE_INFO            = 'hardware_info'
@@ -93,6 +188,11 @@ DEVICE_INFO_BOARD               = 'parent_device'
 DEVICE_INFO_GATE                = 'gate'
 DEVICE_INFO_GATE_DEVICE         = 'device'
 DEVICE_INFO_GATE_CONNECTION     = 'connection'
+# scale and offset of analog outputs saved as integer DAC codes: value = code * scale + offset. see iPCdev.AO_bits.
+DEVICE_INFO_SCALE               = 'scale'
+DEVICE_INFO_OFFSET              = 'offset'
+# True if DDS data is saved as one DEVICE_DATA_DDS_COMPOUND dataset. see iPCdev.DDS_compound.
+DEVICE_INFO_COMPOUND            = 'compound'
 
 # margin for numberical uncertainties
 TIME_EPSILON            = 1e-12
@@ -124,6 +224,8 @@ class iPCdev_device(IntermediateDevice):
         self.connection = clockline_name
         # hardware type identifies the type of connected hardware. we allow only one type per IM device.
         self.hardware_type = None
+        # number of Trigger devices connected. used by iPCdev.__init__ to get the virtual connection of secondary boards.
+        self.num_triggers = 0
 
     def add_device(self, device):
         # get hardware type
@@ -142,6 +244,7 @@ class iPCdev_device(IntermediateDevice):
             # 4. save device hardware information into connection table
             device.set_property(DEVICE_HARDWARE_INFO, device.hardware_info, location='connection_table_properties')
             # 5. add channel to intermediate device. done below.
+            self.num_triggers += 1
         elif isinstance(device, (AnalogOut)):
             hardware_type = HARDWARE_TYPE_AO + HARDWARE_SUBTYPE_NONE + HARDWARE_ADDRTYPE_SINGLE
         elif isinstance(device, (StaticAnalogOut)):
@@ -198,9 +301,99 @@ class iPCdev(PseudoclockDevice):
     DO_type             = np.uint32
     DDS_dtype           = np.float64
 
+    # if True combine_port_data uses the smallest unsigned integer type which fits the highest channel bit of each port.
+    # if False uses DO_type. workers of derived classes reading DEVICE_DATA_DO datasets must not assume DO_type when enabled.
+    DO_compact          = False
+
+    # if not None save analog outputs as signed integer DAC codes with AO_bits <= 32 bits for the voltage range AO_range.
+    # codes are int16 for AO_bits <= 16, otherwise int32. scale and offset are saved into hardware_info and as dataset attributes.
+    # extract_channel_data returns physical values. see quantize_analog_data.
+    AO_bits             = None
+    AO_range            = (-10.0, 10.0)
+
+    # if True save clockline times as int64 number of ticks of clock_resolution instead of float64 seconds.
+    # the resolution is saved as DEVICE_RESOLUTION attribute of the time dataset. see read_times.
+    time_ticks              = False
+
+    # if True save the sub-channels of each DDS as one DEVICE_DATA_DDS_COMPOUND structured dataset with one field per sub-channel.
+    # this is read with one call and each field is a view without copy. static DDS are not affected.
+    # if False save one DEVICE_DATA_DDS dataset per sub-channel.
+    DDS_compound            = False
+
+    # if True all analog outputs created with one call of add_analog_bank without clockline share one clockline.
+    # this requires that the hardware has a common update clock for these channels. each channel has still its own dataset.
+    # if False each analog output has its own clockline.
+    AO_consolidate          = False
+
     # if True share clocklines between boards. if needed overwrite in derived class.
+    # if False the clockline names returned by split_connection must be unique for all boards. see get_device.
     shared_clocklines       = False
 
+    # if True save channel data as (index, value) records of changes when this needs less space than the full data.
+    # workers and runviewer_parser decode data with decode_changes. if needed overwrite in derived class.
+    change_encoding         = False
+
+    # if True save identical time and data arrays only once and create hard links for other IM devices.
+    # this adds the DEVICE_HASH attribute to each dataset and changes the file layout, therefore it is off by default.
+    # readers which open datasets by name are not affected by the hard links. if needed overwrite in derived class.
+    deduplicate             = False
+
+    # storage policy of datasets. if needed overwrite in derived class. see get_storage_options.
+    # None             = use labscript config.compression for all datasets.
+    # dictionary       = use given STORAGE_ entries for all datasets.
+    # STORAGE_ADAPTIVE = select STORAGE_POLICY_SPARSE or STORAGE_POLICY_DENSE for each dataset.
+    storage_policy          = None
+
+    # streaming mode. if needed overwrite in derived class. see save_data_stream.
+    # None    = generate_code combines and saves all data of a dataset at once.
+    # integer = generate_code combines and saves data in chunks such that temporary arrays need about this number of bytes.
+    #           raw data of channels is released after the data of its clockline is saved.
+    stream_memory_limit     = None
+
+    # if True save duration of compilation stages into DEVICE_PROFILE table of board.
+    # if profile_memory is True save also peak memory allocated in each stage. this uses tracemalloc and is slower.
+    # the table adds a dataset to the board group, therefore it is off by default. enable it in derived class when needed.
+    profile_compile         = False
+    profile_memory          = False
+
+    # if True save DEVICE_STATS table with statistics of raw_output of each channel into board group.
+    # workers and runviewer_parser use the table to get final values and active channels without reading channel data.
+    # since the statistics are of the data before combine_channel_data, workers use them only when the saved data is unchanged,
+    # i.e. not for analog outputs saved as DAC codes and not when combine or extract functions are overwritten in derived class.
+    # the table adds a dataset to the board group, therefore it is off by default.
+    channel_stats           = False
+
+    # if True save analog outputs as piecewise-linear segments when this needs less than 1/4 of the space of the samples.
+    # segments are detected from raw_output and are used only when all samples are reproduced within AO_segment_tolerance.
+    # read_data expands segments to samples, derived workers can upload the segments table directly.
+    # with AO_bits the segments are detected from the DAC codes with a tolerance of one LSB. see get_segments.
+    AO_segments             = False
+    AO_segment_tolerance    = 1e-6
+
+    # if True detect exactly periodic blocks of (time difference, data of all channels) of each clockline
+    # and save time and data of the clockline as loops with ENCODING_LOOPS when this needs at most half of the samples.
+    # blocks are repeated at least loop_min_repeats times and have at most loop_max_period samples.
+    # read_data expands loops. derived workers of hardware supporting loops can upload the loops directly. see read_loops.
+    # cannot be used together with stream_memory_limit or compile_cache_size. generate_code raises LabscriptError.
+    loop_compression        = False
+    loop_max_period         = 256
+    loop_min_repeats        = 4
+
+    # number of threads used by generate_code to compress datasets in parallel. 0 = compress serially by HDF5.
+    # gzip compressed chunks (with optional shuffle) of all IM devices of a board are compressed by a thread pool
+    # and written with direct chunk writes in the order the datasets were saved. the file content is identical to the serial path.
+    # see benchmark/parallel_compression.py which checks this. the data of datasets with chunks not yet written is kept in memory.
+    # this is limited to stream_memory_limit or if None to COMPRESS_PENDING_BYTES. when exceeded the oldest datasets are written.
+    # datasets with other filters and datasets saved in streaming mode are written serially. see save_data.
+    compress_workers        = 0
+
+    # maximum size in bytes of the compile cache shared by all shots in the same folder. 0 = disabled.
+    # datasets with the same channel data as in a previous shot are copied from the cache without combining and compressing data.
+    # the new entries of each board and shot are saved into one file. the least recently used files are deleted
+    # when the size is exceeded. see save_data_stream and save_compile_cache.
+    # note: delete the COMPILE_CACHE_FOLDER when you change combine_channel_data or combine_port_data in a derived class.
+    compile_cache_size      = 0
+
     def __init__(self,
                  name,
                  parent_device      = None,
@@ -225,6 +418,46 @@ class iPCdev(PseudoclockDevice):
             self.primary = parent_device
             parent_device = self.primary.parent_device
 
+        # index of intermediate devices with key = IM device name, value = IM device. see get_device.
+        # all iPCdev boards with an iPCdev primary board share the index of the primary board.
+        # datasets saved by save_data with key = content hash, value = dataset. shared like IM_devices.
+        # stack of running profiling stages. shared like IM_devices since stages of boards are nested.
+        # names of all boards with primary board first. shared like IM_devices. saved for sync_boards of the workers.
+        # compile cache index with key = cache key, value = file name and opened cache files with key = file name. shared like IM_devices.
+        if isinstance(self.primary, iPCdev):
+            self.IM_devices    = self.primary.IM_devices
+            self.datasets      = self.primary.datasets
+            self.profile_stack = self.primary.profile_stack
+            self.all_boards    = self.primary.all_boards
+            self.cache_index   = self.primary.cache_index
+            self.cache_files   = self.primary.cache_files
+            self.all_boards.append(name)
+        else:
+            self.IM_devices    = {}
+            self.datasets      = {}
+            self.profile_stack = []
+            self.all_boards    = [name]
+            self.cache_index   = {}
+            self.cache_files   = {}
+        # list of profiling results of this board. see profile_stop.
+        self.profile = []
+        # prepared (IM device, hardware_info) for connections of channels created with add_channels. see add_device.
+        self.bulk_connections = {}
+        # number of AO banks with consolidated clockline. see add_analog_bank.
+        self.AO_banks = 0
+        # number of compile cache hits and misses
+        self.cache_hits   = 0
+        self.cache_misses = 0
+        # list of (key, dataset) of compile cache misses saved at the end of generate_code. see save_compile_cache.
+        self.cache_new    = []
+        # thread pool and list of (dataset, [(offset, future of compressed chunk)], bytes of data) not yet written
+        # and total bytes of data of pending_writes. see compress_workers.
+        self.compress_pool  = None
+        self.pending_writes = []
+        self.pending_bytes  = 0
+        # loop records of actual clockline or None. see loop_compression.
+        self.loops = None
+
         # init device class
         if self.primary is None:
             print("iPCdev init primary '%s'" % (name))
@@ -244,11 +477,8 @@ class iPCdev(PseudoclockDevice):
             #   parent_device must be IntermediateDevice and trigger_connection is not None
             if isinstance(self.primary, iPCdev) and trigger_connection is None:
                 trigger_device = self.primary.virtual_device
-                # count secondary boards connected on virtual device to find its virtual connection
-                index = 0
-                for child in trigger_device.child_devices:
-                    if isinstance(child, Trigger):
-                        index += 1
+                # number of secondary boards connected on virtual device gives its virtual connection
+                index = trigger_device.num_triggers
                 trigger_connection = (VIRTUAL_CON % index)
             elif isinstance(self.parent_device, IntermediateDevice) and trigger_connection is not None:
                 trigger_device = self.parent_device
@@ -265,7 +495,7 @@ class iPCdev(PseudoclockDevice):
         self.set_property('derived_module', self.__module__, location='connection_table_properties')
 
         # save shared_clocklines into connection_table
-        self.set_property('shared_clocklines', iPCdev.shared_clocklines , location='connection_table_properties')
+        self.set_property('shared_clocklines', type(self).shared_clocklines , location='connection_table_properties')
 
     def add_device(self, device, allow_create_new=True):
         if isinstance(device, Pseudoclock):
@@ -273,6 +503,11 @@ class iPCdev(PseudoclockDevice):
             #print('adding pseudoclock', device.name)
             PseudoclockDevice.add_device(self, device)
             device.hardware_info = {DEVICE_INFO_TYPE:HARDWARE_TYPE_PS + HARDWARE_SUBTYPE_NONE + HARDWARE_ADDRTYPE_NONE}
+        elif device.connection in self.bulk_connections:
+            # channel created with add_channels: IM device and hardware_info are already prepared.
+            device.parent_device, device.hardware_info = self.bulk_connections.pop(device.connection)
+            device.set_property(DEVICE_HARDWARE_INFO, device.hardware_info, location='connection_table_properties')
+            device.parent_device.add_device(device)
         else:
             # output channel connected: connect to proper IM device
             # 1. get clockline and hardware names. this might be overwritten in derived class
@@ -300,7 +535,7 @@ class iPCdev(PseudoclockDevice):
         """
         returns intermediate (IM) device for given clockline_name.
         either creates new pseudoclock + clockline + IM device or returns existing IM device.
-        searchs IM device names in primary device list.
+        searchs IM device names in self.IM_devices which is shared by all boards with the same primary board.
         if allow_create_new = False the device must exist, otherwise returns None.
         if allow_create_new = True creates and returns new device if does not exists.
         notes:
@@ -320,39 +555,27 @@ class iPCdev(PseudoclockDevice):
         name_cl  = NAME_CL  % (_clockline_name)
         name_dev = NAME_DEV % (_clockline_name)
 
-        # search IM device with matching pseudoclock name
-        # if shared_clocklines we have to search all boards starting from primary,
-        # otherwise we search only clocklines of this board.
-        # ATTENTION: do not assign devices = self.child_devices and pop out elements below!
-        devices = []
-        if iPCdev.shared_clocklines:
-            if self.primary is None: devices += self.child_devices
-            else:                    devices += self.primary.child_devices
-        else:
-            devices += self.child_devices
-        #print('searching board:', self.name if self.primary is None else self.primary.name)
-        while len(devices) > 0:
-            ps = devices.pop(0)
-            for cl in ps.child_devices:
-                for im in cl.child_devices:
-                    if im.name == name_dev:
-                        # found: return IM device
-                        #print('IM device found: %s' % (im.name))
-                        return im
-                    if iPCdev.shared_clocklines:
-                        for child in im.child_devices:
-                            if isinstance(child, Trigger):
-                                if len(child.child_devices) != 1:
-                                    raise LabscriptError("%s trigger %s has %i boards attached but should be 1! this is a bug." % (self.name, child.name, len(child.child_devices)))
-                                board = next(iter(child.child_devices))
-                                #print('searching board:', board.name)
-                                devices += board.child_devices
+        # search IM device with matching name
+        # if shared_clocklines we return the IM device of any board with the same primary,
+        # otherwise we return only IM devices (i.e. clocklines) of this board.
+        im = self.IM_devices.get(name_dev, None)
+        if im is not None:
+            if type(self).shared_clocklines or (im.parent_device.parent_device.parent_device is self):
+                # found: return IM device
+                #print('IM device found: %s' % (im.name))
+                return im
 
         #print('IM device not found for', name_dev)
 
         # return None if not existing and we should not create a new one.
         if not allow_create_new: return None
 
+        # IM device with the same name created by another board: a new device would have the same names
+        # and would replace the existing device in self.IM_devices which is shared by all boards.
+        if im is not None:
+            raise LabscriptError("%s clockline '%s' is already used by board '%s'!\ngive unique clockline names or set shared_clocklines = True." % (
+                                 self.name, clockline_name, im.parent_device.parent_device.parent_device.name))
+
         # not found: create new pseudoclock, clockline and intermediate device
         ps = _iPCdev(
             name                = name_ps,
@@ -370,9 +593,96 @@ class iPCdev(PseudoclockDevice):
             board_name          = self.name,
             clockline_name      = clockline_name,
         )
+        self.IM_devices[name_dev] = im
         # return new IM device
         return im
 
+    def add_channels(self, channel_class, names, connections, hardware_infos, **kwargs):
+        """
+        creates channels of channel_class with given names and connections which share the same IM device.
+        returns list of created channels.
+        hardware_infos = list of dictionaries used to update the hardware_info of the first channel for the other channels.
+        kwargs         = additional arguments given to each channel.
+        only the connection of the first channel is parsed with split_connection and its IM device is found or created with get_device.
+        for all other channels the hardware_info of the first channel is copied and updated with the given hardware_infos.
+        the address and channel of each hardware_info are checked for valid integers and for duplicates on the same IM device.
+        if split_connection is overwritten in a derived class all channels are created individually,
+        such that split_connection is called for each channel.
+        raises LabscriptError on error.
+        """
+        if type(self).split_connection is not iPCdev.split_connection:
+            return [channel_class(name=name, parent_device=self, connection=connection, **kwargs) for name, connection in zip(names, connections)]
+        channels = [channel_class(name=names[0], parent_device=self, connection=connections[0], **kwargs)]
+        IM = channels[0].parent_device
+        # (board, address, channel) of all channels of IM device
+        used = set([(dev.hardware_info[DEVICE_INFO_BOARD], dev.hardware_info[DEVICE_INFO_ADDRESS], dev.hardware_info[DEVICE_INFO_CHANNEL]) for dev in IM.child_devices])
+        merged = (channels[0].hardware_info[DEVICE_INFO_TYPE][HARDWARE_ADDRTYPE] == HARDWARE_ADDRTYPE_MERGED)
+        try:
+            for name, connection, hardware_info in zip(names[1:], connections[1:], hardware_infos[1:]):
+                _hardware_info = channels[0].hardware_info.copy()
+                _hardware_info.update(hardware_info)
+                address = _hardware_info[DEVICE_INFO_ADDRESS]
+                channel = _hardware_info[DEVICE_INFO_CHANNEL]
+                if not isinstance(address, (int, np.integer)) or (address < 0) or \
+                   (merged and (not isinstance(channel, (int, np.integer)) or (channel < 0) or (channel >= np.dtype(np.uint64).itemsize*8))):
+                    raise LabscriptError("%s add_channels: device '%s' connection '%s' address %s channel %s invalid!" % (self.name, name, connection, str(address), str(channel)))
+                key = (_hardware_info[DEVICE_INFO_BOARD], address, channel)
+                if (key in used) or (connection in self.bulk_connections):
+                    raise LabscriptError("%s add_channels: device '%s' connection '%s' is already used!" % (self.name, name, connection))
+                used.add(key)
+                self.bulk_connections[connection] = (IM, _hardware_info)
+            for name, connection in zip(names[1:], connections[1:]):
+                channels.append(channel_class(name=name, parent_device=self, connection=connection, **kwargs))
+        finally:
+            self.bulk_connections.clear()
+        return channels
+
+    def add_digital_port(self, address, names, channels=None, clockline=None, static=False, **kwargs):
+        """
+        creates DigitalOut (or StaticDigitalOut if static) channels with given names on the same address (port).
+        returns list of created channels.
+        address   = port address as integer or string.
+        names     = list of channel names.
+        channels  = list of channel numbers (bits). if None uses 0, 1, ... len(names)-1.
+        clockline = optional clockline part of connection.
+        kwargs    = additional arguments given to each channel.
+        the connection '[clockline/]address/channel' is parsed only for the first channel. see add_channels.
+        """
+        if channels is None: channels = list(range(len(names)))
+        if len(channels) != len(names):
+            raise LabscriptError("%s add_digital_port: %i names but %i channels given!" % (self.name, len(names), len(channels)))
+        if len(names) == 0: return []
+        prefix = ('' if clockline is None else (str(clockline) + CON_SEP)) + (('0x%x' % address) if isinstance(address, int) else address) + CON_SEP
+        connections    = [prefix + ('0x%x' % channel) for channel in channels]
+        hardware_infos = [{DEVICE_INFO_CHANNEL: channel} for channel in channels]
+        return self.add_channels(StaticDigitalOut if static else DigitalOut, names, connections, hardware_infos, **kwargs)
+
+    def add_analog_bank(self, addresses, names, clockline=None, static=False, **kwargs):
+        """
+        creates AnalogOut (or StaticAnalogOut if static) channels with given names and addresses.
+        returns list of created channels.
+        addresses = list of integer addresses.
+        names     = list of channel names.
+        clockline = optional clockline part of connection.
+                    if None and AO_consolidate is False each channel has its own clockline and is created individually.
+                    if None and AO_consolidate is True all channels share a new clockline NAME_AO_BANK.
+                    if given all channels share this clockline and the connection is parsed only for the first channel.
+        kwargs    = additional arguments given to each channel.
+        """
+        if len(addresses) != len(names):
+            raise LabscriptError("%s add_analog_bank: %i names but %i addresses given!" % (self.name, len(names), len(addresses)))
+        if len(names) == 0: return []
+        if (clockline is None) and type(self).AO_consolidate:
+            clockline = NAME_AO_BANK % (self.AO_banks)
+            self.AO_banks += 1
+        channel_class = StaticAnalogOut if static else AnalogOut
+        prefix = '' if clockline is None else (str(clockline) + CON_SEP)
+        connections = [prefix + ('0x%x' % address) for address in addresses]
+        if clockline is None:
+            return [channel_class(name=name, parent_device=self, connection=connection, **kwargs) for name, connection in zip(names, connections)]
+        hardware_infos = [{DEVICE_INFO_ADDRESS: address} for address in addresses]
+        return self.add_channels(channel_class, names, connections, hardware_infos, **kwargs)
+
     ###############################################################
     # following functions might be overwritten in a derived class #
     ###############################################################
@@ -536,11 +846,98 @@ class iPCdev(PseudoclockDevice):
         # return combined data or None on error
         return data
 
+    @classmethod
+    def combine_port_data(cls, hardware_infos, raw_outputs):
+        """
+        TODO: overwrite in derived class if you need your own implementation.
+        returns combined data of all channels with same board and address (port).
+        hardware_infos = list of hardware_info of each channel of the port.
+        raw_outputs    = list of numpy arrays of raw data of each channel. all must have the same length.
+        raises LabscriptError if a channel is invalid or cannot be combined.
+        implementation-details:
+        - if combine_channel_data is overwritten in derived class we call it for each channel.
+        - otherwise for HARDWARE_ADDRTYPE_MERGED the lowest bit of each channel is put into a bit matrix
+          with one row per data bit which is packed with np.packbits into the data word.
+          this avoids temporary arrays of the data word type for each channel.
+          if DO_compact the data word is the smallest unsigned integer type fitting the highest channel, otherwise DO_type.
+        - all other address types are combined with combine_channel_data.
+        """
+        addr_type = hardware_infos[0][DEVICE_INFO_TYPE][HARDWARE_ADDRTYPE]
+        if (cls.combine_channel_data is not iPCdev.combine_channel_data) or (addr_type != HARDWARE_ADDRTYPE_MERGED):
+            # fallback: combine each channel individually
+            data = None
+            for hardware_info, raw_output in zip(hardware_infos, raw_outputs):
+                data = cls.combine_channel_data(hardware_info, raw_output, data)
+                if data is None:
+                    raise LabscriptError("%s combine_port_data: channel %s of port %s address %s could not be combined!" % (
+                                         cls.__name__, str(hardware_info[DEVICE_INFO_CHANNEL]), str(hardware_info[DEVICE_INFO_BOARD]), str(hardware_info[DEVICE_INFO_ADDRESS])))
+            return data
+        # digital out: pack lowest bit of all channels into preallocated data words
+        dtype    = np.dtype(np.uint64 if cls.DO_compact else cls.DO_type)
+        channels = [hardware_info[DEVICE_INFO_CHANNEL] for hardware_info in hardware_infos]
+        for hardware_info, channel in zip(hardware_infos, channels):
+            if (channel is None) or (channel < 0) or (channel >= dtype.itemsize*8):
+                raise LabscriptError("%s combine_port_data: channel %s of port %s address %s invalid! give 0 - %i." % (
+                                     cls.__name__, str(channel), str(hardware_info[DEVICE_INFO_BOARD]), str(hardware_info[DEVICE_INFO_ADDRESS]), dtype.itemsize*8 - 1))
+        num_bytes = max(channels)//8 + 1
+        if cls.DO_compact:
+            dtype = np.dtype(np.uint8 if num_bytes == 1 else np.uint16 if num_bytes == 2 else np.uint32 if num_bytes <= 4 else np.uint64)
+        matrix = np.zeros(shape=(num_bytes*8, len(raw_outputs[0])), dtype=np.uint8)
+        for channel, raw_output in zip(channels, raw_outputs):
+            np.bitwise_and(raw_output, 1, out=matrix[channel], casting='unsafe')
+        # packbits gives (bytes, samples) with lowest bit first. bytes are copied into little-endian data words.
+        words = np.zeros(shape=(len(raw_outputs[0]), dtype.itemsize), dtype=np.uint8)
+        words[:,:num_bytes] = np.packbits(matrix, axis=0, bitorder='little').T
+        del matrix
+        return words.view(dtype.newbyteorder('<'))[:,0].astype(dtype, copy=False)
+
+    @classmethod
+    def combine_dds_data(cls, hardware_info, subdevs, start, stop):
+        """
+        returns structured array with data[start:stop] of all sub-channels of a DDS combined with combine_channel_data.
+        the field names are the sub-channel connections.
+        """
+        fields = [(subdev.connection, cls.combine_channel_data(hardware_info, subdev.raw_output[start:stop], None)) for subdev in subdevs]
+        data = np.empty(shape=(stop - start,), dtype=[(connection, field.dtype) for connection, field in fields])
+        for connection, field in fields:
+            data[connection] = field
+        return data
+
+    @classmethod
+    def get_analog_scaling(cls):
+        """
+        returns (scale, offset, dtype) for analog outputs saved as integer DAC codes or None if AO_bits is None.
+        codes are in the symmetric range +/-(2**(AO_bits-1)-1) around the center of AO_range.
+        """
+        if cls.AO_bits is None: return None
+        if (cls.AO_bits < 2) or (cls.AO_bits > 32):
+            raise LabscriptError("%s AO_bits %i invalid! give 2 - 32 bits." % (cls.__name__, cls.AO_bits))
+        (minimum, maximum) = cls.AO_range
+        offset = (maximum + minimum) / 2
+        scale  = (maximum - minimum) / 2 / (2**(cls.AO_bits-1) - 1)
+        return (scale, offset, np.int16 if cls.AO_bits <= 16 else np.int32)
+
+    @classmethod
+    def quantize_analog_data(cls, hardware_info, data):
+        """
+        returns analog data as integer DAC codes when AO_bits is not None, otherwise returns data unchanged.
+        hardware_info must contain DEVICE_INFO_SCALE and DEVICE_INFO_OFFSET given by get_analog_scaling.
+        raises LabscriptError if data is outside of AO_range.
+        """
+        if cls.AO_bits is None: return data
+        (minimum, maximum) = cls.AO_range
+        if len(data) > 0 and ((np.min(data) < minimum) or (np.max(data) > maximum)):
+            raise LabscriptError("%s analog output data [%f, %f] outside of range [%f, %f]!" % (cls.__name__, np.min(data), np.max(data), minimum, maximum))
+        dtype = cls.get_analog_scaling()[2]
+        return np.round((data - hardware_info[DEVICE_INFO_OFFSET]) / hardware_info[DEVICE_INFO_SCALE]).astype(dtype)
+
     @staticmethod
     def extract_channel_data(hardware_info, combined_channel_data):
         """
         TODO: overwrite in derived class if you need your own implementation.
         returns channel data from combined_channel_data for the given device.
+        combined_channel_data can be encoded with encode_changes.
+        for analog outputs saved as integer DAC codes returns physical values using the scale and offset in hardware_info.
         returns None on error.
         inverse function to combine_channel_aata. for description see there.
         """
@@ -548,8 +945,14 @@ class iPCdev(PseudoclockDevice):
         channel   = hardware_info[DEVICE_INFO_CHANNEL]
         addr_type = hardware_info[DEVICE_INFO_TYPE][HARDWARE_ADDRTYPE]
         channel_data = None
+        # decode data saved with encode_changes
+        combined_channel_data = iPCdev.decode_changes(combined_channel_data)
         if (addr_type == HARDWARE_ADDRTYPE_SINGLE) or (addr_type == HARDWARE_ADDRTYPE_MULTIPLE):
-            channel_data = combined_channel_data
+            if (DEVICE_INFO_SCALE in hardware_info) and (combined_channel_data.dtype.kind == 'i'):
+                # integer DAC codes saved by quantize_analog_data
+                channel_data = combined_channel_data * hardware_info[DEVICE_INFO_SCALE] + hardware_info[DEVICE_INFO_OFFSET]
+            else:
+                channel_data = combined_channel_data
         elif addr_type == HARDWARE_ADDRTYPE_MERGED:
             if channel is not None and channel >= 0:
                 channel_data = ((combined_channel_data >> channel) & 1).astype(bool)
@@ -558,26 +961,840 @@ class iPCdev(PseudoclockDevice):
         # return extracted channel data or None on error
         return channel_data
 
+    @classmethod
+    def extract_port_data(cls, hardware_infos, combined_channel_data):
+        """
+        TODO: overwrite in derived class together with extract_channel_data if needed.
+        returns list of channel data for all channels of the same board and address (port) with given hardware_infos.
+        this is the inverse function of combine_port_data.
+        all bits of the port are unpacked at once with np.unpackbits into a (bits, samples) boolean array
+        and each channel data is a read-only view of one row of this array. channels with the same bit share the same view.
+        if extract_channel_data is overwritten in a derived class or a channel is invalid calls extract_channel_data for each channel.
+        in this case each channel data is a separate array which is also set read-only.
+        """
+        combined_channel_data = iPCdev.decode_changes(combined_channel_data)
+        channels = [hardware_info[DEVICE_INFO_CHANNEL] for hardware_info in hardware_infos]
+        if (cls.extract_channel_data is not iPCdev.extract_channel_data) or \
+           (combined_channel_data.dtype.kind not in 'ui') or \
+           any([(channel is None) or (channel < 0) or (channel >= combined_channel_data.dtype.itemsize*8) for channel in channels]):
+            channels = [cls.extract_channel_data(hardware_info, combined_channel_data) for hardware_info in hardware_infos]
+            for channel_data in channels:
+                if isinstance(channel_data, np.ndarray): channel_data.flags.writeable = False
+            return channels
+        words = combined_channel_data.astype(combined_channel_data.dtype.newbyteorder('<'), copy=False)
+        words = np.ascontiguousarray(words).view(np.uint8).reshape(len(words), -1)
+        bits  = np.ascontiguousarray(np.unpackbits(words, axis=1, bitorder='little').T).view(bool)
+        bits.flags.writeable = False
+        return [bits[channel] for channel in channels]
+
+    @staticmethod
+    def encode_changes(data):
+        """
+        returns structured array with (index, value) records for each change of data.
+        the first record is (0, data[0]) and the last record (len(data), data[-1]) gives the length of data.
+        this is the inverse function of decode_changes.
+        """
+        changes = np.concatenate(([0], np.flatnonzero(data[1:] != data[:-1]) + 1, [len(data)]))
+        encoded = np.empty(shape=(len(changes),), dtype=[(ENCODING_INDEX, np.int64), (ENCODING_VALUE, data.dtype)])
+        encoded[ENCODING_INDEX] = changes
+        encoded[ENCODING_VALUE][:-1] = data[changes[:-1]]
+        encoded[ENCODING_VALUE][-1] = data[-1]
+        return encoded
+
+    @classmethod
+    def get_segments(cls, times, data):
+        """
+        returns SEGMENTS_DTYPE table of piecewise-linear segments for data at times, or None if data cannot be represented.
+        a new segment starts at each sample where the step deviates by more than the tolerance
+        from the extrapolation of the previous step. jumps are segments between two samples.
+        returns None if expand_segments deviates by more than the tolerance from data.
+        for float data the tolerance is AO_segment_tolerance.
+        for integer DAC codes of quantize_analog_data the tolerance is one code, i.e. one LSB of AO_bits.
+        """
+        if (len(data) < 3) or (len(data) != len(times)):
+            return None
+        integer = (data.dtype.kind in 'iu')
+        values = data.astype(np.float64) if integer else data
+        tolerance = 1.0 if integer else cls.AO_segment_tolerance
+        dt = np.diff(times)
+        dv = np.diff(values)
+        deviation = np.abs(dv[1:] - dv[:-1] / dt[:-1] * dt[1:])
+        index = np.concatenate(([0], np.flatnonzero(deviation > tolerance) + 1, [len(data) - 1]))
+        segments = np.empty(shape=(len(index) - 1,), dtype=SEGMENTS_DTYPE)
+        segments['t_start'] = times[index[:-1]]
+        segments['t_end']   = times[index[1:]]
+        segments['v_start'] = values[index[:-1]]
+        segments['v_end']   = values[index[1:]]
+        if np.max(np.abs(iPCdev.expand_segments(segments, times) - values)) > tolerance:
+            return None
+        return segments
+
+    @staticmethod
+    def expand_segments(segments, times):
+        """
+        returns samples at times of the segments table of get_segments. this is the inverse function of get_segments.
+        each time uses the last segment starting at or before this time.
+        """
+        t_start  = segments['t_start']
+        index    = np.clip(np.searchsorted(t_start, times, side='right') - 1, 0, len(segments) - 1)
+        duration = segments['t_end'] - t_start
+        slope    = np.divide(segments['v_end'] - segments['v_start'], duration, out=np.zeros_like(duration), where=(duration > 0))
+        return segments['v_start'][index] + slope[index] * (times - t_start[index])
+
+    @staticmethod
+    def decode_changes(data):
+        """
+        returns data decoded from (index, value) records of encode_changes.
+        if data is not encoded returns data unchanged.
+        """
+        if data.dtype.names is None or ENCODING_INDEX not in data.dtype.names:
+            return data
+        return np.repeat(data[ENCODING_VALUE][:-1], np.diff(data[ENCODING_INDEX]))
+
+    def save_data(self, group, name, data, encode=True):
+        """
+        creates dataset with given name in group and saves data.
+        if encode and change_encoding are True and if this needs less space saves data encoded with encode_changes.
+        the encoding is saved in the DEVICE_ENCODING attribute of the dataset.
+        if deduplicate is True and data with the same content was already saved by any board of the same primary,
+        creates a hard link to the existing dataset instead of a new dataset.
+        the hex digest of the content is saved in the DEVICE_HASH attribute of the dataset.
+        compression and chunk size are given by get_storage_options.
+        if compress_workers > 0 and the dataset uses only gzip and shuffle filters, the chunks are compressed in parallel
+        and written when the memory limit of pending datasets is exceeded or with flush_writes at the end of generate_code.
+        returns dataset.
+        """
+        encoding = None
+        if encode and type(self).change_encoding and len(data) > 2:
+            encoded = iPCdev.encode_changes(data)
+            if encoded.nbytes < data.nbytes:
+                data     = encoded
+                encoding = ENCODING_CHANGES
+        if type(self).deduplicate:
+            data = np.ascontiguousarray(data)
+            digest = sha1(data.view(np.uint8)).hexdigest()
+            key = (digest, data.dtype.str, data.shape)
+            dataset = self.datasets.get(key, None)
+            if (dataset is not None) and dataset.id.valid and (dataset.file == group.file):
+                # same data already saved: create hard link
+                group[name] = dataset
+                return dataset
+        if type(self).compress_workers > 0:
+            dataset = group.create_dataset(name, shape=data.shape, dtype=data.dtype, **type(self).get_storage_options(name, data))
+            if not self.compress_data(dataset, data):
+                dataset[()] = data
+        else:
+            dataset = group.create_dataset(name, data=data, **type(self).get_storage_options(name, data))
+        if encoding is not None:
+            dataset.attrs[DEVICE_ENCODING] = encoding
+        if type(self).deduplicate:
+            dataset.attrs[DEVICE_HASH] = digest
+            self.datasets[key] = dataset
+        return dataset
+
+    @staticmethod
+    def compress_chunk(chunk, level, shuffle):
+        """
+        returns bytes of chunk compressed like the HDF5 shuffle and deflate filters.
+        """
+        if shuffle and chunk.dtype.itemsize > 1:
+            chunk = chunk.view(np.uint8).reshape(-1, chunk.dtype.itemsize).T
+        return zlib.compress(np.ascontiguousarray(chunk).tobytes(), level)
+
+    def compress_data(self, dataset, data):
+        """
+        submits compression of all chunks of data to the compress_pool and adds the chunks to pending_writes.
+        returns True if submitted, or False when the dataset cannot be written with direct chunk writes.
+        this is the case for not chunked or not gzip compressed datasets, for other filters and for multi-dimensional data.
+        """
+        if (dataset.chunks is None) or (dataset.compression != 'gzip') or dataset.fletcher32 or \
+           (dataset.scaleoffset is not None) or (data.ndim != 1) or (len(data) == 0):
+            return False
+        if self.compress_pool is None:
+            self.compress_pool = ThreadPoolExecutor(max_workers=type(self).compress_workers)
+        size = dataset.chunks[0]
+        chunks = []
+        for start in range(0, len(data), size):
+            chunk = data[start:start+size]
+            if len(chunk) < size:
+                # HDF5 saves edge chunks with full size filled with zeros
+                chunk = np.concatenate([chunk, np.zeros(size - len(chunk), dtype=data.dtype)])
+            chunks.append(((start,), self.compress_pool.submit(iPCdev.compress_chunk, chunk, dataset.compression_opts, dataset.shuffle)))
+        self.pending_writes.append((dataset, chunks, data.nbytes))
+        self.pending_bytes += data.nbytes
+        # limit memory of pending datasets
+        limit = type(self).stream_memory_limit
+        self.write_pending(COMPRESS_PENDING_BYTES if limit is None else limit)
+        return True
+
+    def write_pending(self, limit):
+        """
+        writes chunks compressed by compress_data of the oldest datasets until the data of the remaining datasets is <= limit bytes.
+        waits until the chunks are compressed. the chunks of the last dataset are written when limit is exceeded by this dataset alone.
+        """
+        while (len(self.pending_writes) > 0) and (self.pending_bytes > limit):
+            dataset, chunks, nbytes = self.pending_writes.pop(0)
+            for offset, future in chunks:
+                dataset.id.write_direct_chunk(offset, future.result(), 0)
+            self.pending_bytes -= nbytes
+
+    def flush_writes(self):
+        """
+        writes all chunks compressed by compress_data in the order they were submitted and shuts down the compress_pool.
+        """
+        if self.compress_pool is None: return
+        self.profile_start()
+        self.write_pending(0)
+        self.compress_pool.shutdown()
+        self.compress_pool = None
+        self.profile_stop(PROFILE_FLUSH, self.name)
+
+    @classmethod
+    def get_loops(cls, times, arrays):
+        """
+        returns LOOPS_DTYPE records of exactly periodic blocks of times and arrays or None if not found.
+        arrays = list of raw data of all channels of the clockline with same length as times.
+        blocks are searched for all periods up to loop_max_period samples with at least loop_min_repeats repetitions
+        and the non-overlapping blocks saving most samples are taken. samples between blocks are records with repeats = 1.
+        blocks of multiples of a period are not taken when they are inside a block of this period.
+        only the LOOPS_MAX_CANDIDATES blocks saving most samples are considered.
+        returns None if loops need more than half of the samples or more than LOOPS_MAX_RECORDS records.
+        the records are saved as DEVICE_LOOPS attribute by save_loop_data which limits the number of records
+        since HDF5 attributes are limited to 64kB.
+        """
+        n = len(times)
+        if n < 2*cls.loop_min_repeats: return None
+        # each sample is a row of time difference and channel data. equal rows get the same symbol.
+        dt = np.round(np.diff(times, prepend=times[0]), ROUND_DIGITS)
+        rows = np.column_stack([dt] + [np.asarray(array, dtype=np.float64) for array in arrays])
+        symbols = np.unique(rows, axis=0, return_inverse=True)[1].reshape(-1)
+        # runs[period] = index of block of period for each sample i with symbols[i] == symbols[i + period], otherwise -1
+        runs = {}
+        candidates = []
+        for period in range(1, min(cls.loop_max_period, n // cls.loop_min_repeats) + 1):
+            equal = (symbols[period:] == symbols[:-period])
+            # samples inside a block of a divisor of period repeat already with the divisor
+            for divisor, run in runs.items():
+                if (period % divisor) == 0:
+                    shift = period - divisor
+                    equal &= ~((run[:len(equal)] >= 0) & (run[:len(equal)] == run[shift:shift + len(equal)]))
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], equal.view(np.int8), [0]))))
+            starts = edges[0::2]
+            repeats = (edges[1::2] - starts) // period + 1
+            valid = (repeats >= cls.loop_min_repeats)
+            if not np.any(valid): continue
+            starts, repeats, ends = starts[valid], repeats[valid], edges[1::2][valid]
+            run = np.cumsum(np.bincount(starts, minlength=n)) - 1
+            run[np.cumsum(np.bincount(starts, minlength=n) - np.bincount(ends, minlength=n)) == 0] = -1
+            runs[period] = run
+            candidates.append(np.column_stack((period*(repeats - 1), np.full(len(starts), period), starts, repeats)))
+        if len(candidates) == 0: return None
+        candidates = np.concatenate(candidates)
+        # take non-overlapping blocks saving most samples. for same saving take shorter period.
+        candidates = candidates[np.lexsort((candidates[:,1], -candidates[:,0]))][:LOOPS_MAX_CANDIDATES]
+        covered = np.zeros(n, dtype=bool)
+        blocks = []
+        for (saving, period, start, repeat) in candidates.tolist():
+            if not np.any(covered[start:start + period*repeat]):
+                covered[start:start + period*repeat] = True
+                blocks.append((start, period, repeat))
+        blocks.sort()
+        # records in order of samples including samples between blocks
+        records = []
+        position = 0
+        for (start, period, repeat) in blocks + [(n, 0, 0)]:
+            if start > position: records.append((start - position, 1, position))
+            if period > 0: records.append((period, repeat, start))
+            position = start + period*repeat
+        # the records must fit into the DEVICE_LOOPS attribute of 64kB
+        if len(records) > LOOPS_MAX_RECORDS: return None
+        records = np.array(records, dtype=np.int64)
+        loops = np.empty(shape=(len(records),), dtype=LOOPS_DTYPE)
+        loops['length']  = records[:,0]
+        loops['repeats'] = records[:,1]
+        loops['offset']  = np.concatenate(([0], np.cumsum(loops['length'])[:-1]))
+        if 2*np.sum(loops['length']) > n: return None
+        return loops
+
+    @staticmethod
+    def expand_loops(samples, loops, delta=False):
+        """
+        returns samples expanded with the LOOPS_DTYPE records loops. this is the inverse function of compress_loops.
+        if delta is True returns the cumulative sum of the expanded samples. float times are rounded to ROUND_DIGITS.
+        """
+        lengths = loops['length']
+        sizes   = lengths * loops['repeats']
+        record  = np.repeat(np.arange(len(loops)), sizes)
+        position = np.arange(np.sum(sizes)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        data = samples[loops['offset'][record] + position % lengths[record]]
+        if delta:
+            data = np.cumsum(data)
+            if data.dtype.kind == 'f':
+                data = np.round(data, ROUND_DIGITS)
+        return data
+
+    @staticmethod
+    def compress_loops(data, loops, delta=False):
+        """
+        returns samples of data compressed with the LOOPS_DTYPE records of get_loops.
+        if delta is True compresses the differences of data. float times are rounded to ROUND_DIGITS.
+        returns None if expand_loops does not give data, i.e. data does not repeat like the loops.
+        """
+        if delta:
+            samples = np.diff(data, prepend=data.dtype.type(0))
+            if samples.dtype.kind == 'f':
+                samples = np.round(samples, ROUND_DIGITS)
+        else:
+            samples = data
+        # first block of each record in the order of the samples
+        lengths  = loops['length']
+        starts   = np.concatenate(([0], np.cumsum(lengths * loops['repeats'])[:-1]))
+        index    = np.repeat(starts - loops['offset'], lengths) + np.arange(np.sum(lengths))
+        samples  = samples[index]
+        expanded = iPCdev.expand_loops(samples, loops, delta)
+        if delta and (data.dtype.kind == 'f'):
+            if np.max(np.abs(expanded - data)) > TIME_EPSILON: return None
+        elif not np.array_equal(expanded, data):
+            return None
+        return samples
+
+    def save_loop_data(self, group, name, data, delta=False):
+        """
+        saves data compressed with the loops of the actual clockline.
+        returns dataset or None if data does not repeat like the loops.
+        loop datasets are not deduplicated since datasets with the same samples might have different loops.
+        """
+        samples = iPCdev.compress_loops(data, self.loops, delta)
+        if samples is None: return None
+        dataset = group.create_dataset(name, data=samples, **type(self).get_storage_options(name, samples))
+        dataset.attrs[DEVICE_ENCODING] = ENCODING_LOOPS
+        dataset.attrs[DEVICE_LOOPS]    = self.loops
+        dataset.attrs[DEVICE_DELTA]    = delta
+        return dataset
+
+    @staticmethod
+    def read_loops(group, name):
+        """
+        returns (samples, loops, delta) of a dataset saved with ENCODING_LOOPS or None if dataset is not saved as loops.
+        use this in derived workers to upload loops directly to hardware which supports loops. see expand_loops.
+        """
+        dataset = group[name]
+        if dataset.attrs.get(DEVICE_ENCODING, None) != ENCODING_LOOPS: return None
+        return (dataset[()], dataset.attrs[DEVICE_LOOPS], bool(dataset.attrs[DEVICE_DELTA]))
+
+    def save_data_stream(self, group, name, length, get_data, encode=True, inputs=None, delta=False):
+        """
+        creates dataset with given name in group and saves data of given length.
+        get_data(start, stop) must return data[start:stop].
+        if loops of the clockline are detected saves data compressed with the loops. see loop_compression.
+        delta = if True the loops are applied to the differences of data. use this for times.
+        if stream_memory_limit is None calls save_data with all data.
+        otherwise creates resizable dataset and saves data in chunks of at least STREAM_MIN_SAMPLES samples
+        such that the temporary arrays need about stream_memory_limit bytes.
+        inputs = None or list of (hardware_info, array) from which get_data combines the data.
+                 if given and compile_cache_size > 0 the dataset is copied from the compile cache when existing,
+                 otherwise the dataset is saved into the compile cache. see get_cache_key.
+        notes:
+        - in streaming mode data is not encoded with encode_changes and not deduplicated, but the DEVICE_HASH attribute is saved.
+          later datasets with same data are linked to the streamed dataset.
+        - storage options are determined from the first chunk.
+        returns dataset.
+        """
+        limit = type(self).stream_memory_limit
+        profile_name = group.name.split(DEVICE_SEP)[-1] + DEVICE_SEP + name
+        key = None
+        if self.loops is not None:
+            self.profile_start()
+            data = get_data(0, length)
+            self.profile_stop(PROFILE_COMBINE, profile_name)
+            self.profile_start()
+            dataset = self.save_loop_data(group, name, data, delta)
+            if dataset is None:
+                dataset = self.save_data(group, name, data, encode=encode)
+            self.profile_stop(PROFILE_WRITE, profile_name)
+            return dataset
+        if (type(self).compile_cache_size > 0) and (inputs is not None):
+            self.profile_start()
+            key = self.get_cache_key(inputs, encode)
+            dataset = self.load_cached_data(group, name, key)
+            if dataset is not None:
+                self.profile_stop(PROFILE_CACHE, profile_name)
+                return dataset
+            self.profile_stop(PROFILE_CACHE, profile_name)
+        if (limit is None) or (length == 0):
+            self.profile_start()
+            data = get_data(0, length)
+            self.profile_stop(PROFILE_COMBINE, profile_name)
+            self.profile_start()
+            dataset = self.save_data(group, name, data, encode=encode)
+            self.profile_stop(PROFILE_WRITE, profile_name)
+        else:
+            self.profile_start()
+            samples = max(STREAM_MIN_SAMPLES, limit // STREAM_BYTES_PER_SAMPLE)
+            dataset = None
+            digest = sha1()
+            for start in range(0, length, samples):
+                stop = min(start + samples, length)
+                data = np.ascontiguousarray(get_data(start, stop))
+                if dataset is None:
+                    options = type(self).get_storage_options(name, data)
+                    if STORAGE_CHUNKS not in options:
+                        options[STORAGE_CHUNKS] = (min(samples, length),)
+                    dataset = group.create_dataset(name, shape=(0,), maxshape=(None,), dtype=data.dtype, **options)
+                dataset.resize((stop,))
+                dataset[start:stop] = data
+                digest.update(data.view(np.uint8))
+            if type(self).deduplicate:
+                digest = digest.hexdigest()
+                dataset.attrs[DEVICE_HASH] = digest
+                self.datasets.setdefault((digest, dataset.dtype.str, dataset.shape), dataset)
+            self.profile_stop(PROFILE_STREAM, profile_name)
+        if key is not None:
+            # new cache entry is saved at the end of generate_code after all pending chunks are written
+            self.datasets[key] = dataset
+            self.cache_new.append((key, dataset))
+        return dataset
+
+    def get_cache_key(self, inputs, encode):
+        """
+        returns compile cache key for the given inputs.
+        inputs = list of (hardware_info, array) from which the data of a dataset is combined.
+        the key is the hex digest of the arrays, of the hardware type and channel of each hardware_info
+        and of all class settings which change the saved dataset.
+        this includes all inputs of get_storage_options: storage_policy, labscript config.compression,
+        the adaptive policy constants and the implementation of get_storage_options, which might be overwritten.
+        the address is not used since it does not change the data. so channels with same data share the same entry.
+        """
+        digest = sha1()
+        get_storage_options = type(self).get_storage_options.__func__
+        storage = (str(type(self).storage_policy), str(config.compression),
+                   STORAGE_MIN_BYTES, STORAGE_SPARSE, str(STORAGE_POLICY_SPARSE), str(STORAGE_POLICY_DENSE),
+                   get_storage_options.__module__, get_storage_options.__qualname__)
+        settings = (COMPILE_CACHE_VERSION, type(self).__module__, type(self).__name__, encode,
+                    type(self).change_encoding, storage, type(self).stream_memory_limit,
+                    str(type(self).AO_dtype), str(type(self).DO_type), str(type(self).DDS_dtype),
+                    type(self).DO_compact, type(self).AO_bits, tuple(type(self).AO_range),
+                    type(self).time_ticks, type(self).clock_resolution, type(self).DDS_compound)
+        digest.update(repr(settings).encode())
+        for hardware_info, array in inputs:
+            if hardware_info is not None:
+                digest.update(repr((hardware_info[DEVICE_INFO_TYPE], hardware_info[DEVICE_INFO_CHANNEL])).encode())
+            array = np.ascontiguousarray(array)
+            digest.update(repr((array.dtype.str, array.shape)).encode())
+            digest.update(array.view(np.uint8))
+        return digest.hexdigest()
+
+    def get_cache_folder(self, group):
+        """
+        returns compile cache folder in the folder of the hdf5 file of group. creates folder if not existing.
+        """
+        folder = os.path.join(os.path.dirname(os.path.abspath(group.file.filename)), COMPILE_CACHE_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def get_cache_index(self, group):
+        """
+        returns compile cache index with key = cache key, value = file name of the cache folder of group.
+        the index is built when called the first time for a shot by reading the dataset names of all cache files.
+        """
+        if len(self.cache_files) == 0:
+            folder = self.get_cache_folder(group)
+            for entry in os.scandir(folder):
+                if not (entry.is_file() and entry.name.endswith(COMPILE_CACHE_FILE % '')): continue
+                try:
+                    with h5py.File(entry.path, 'r') as f:
+                        keys = list(f.keys())
+                except OSError as e:
+                    print("warning: compile cache file '%s' invalid (%s)" % (entry.path, str(e)))
+                    continue
+                self.cache_files[entry.path] = None
+                for key in keys:
+                    self.cache_index[key] = entry.path
+        return self.cache_index
+
+    def load_cached_data(self, group, name, key):
+        """
+        copies dataset with given compile cache key into group with given name.
+        if the same key was already loaded or saved for this shot creates a hard link to this dataset.
+        the dataset is copied with all chunks and attributes without decompression.
+        the cache files are opened once per shot and closed by close_compile_cache.
+        returns dataset or None when the key is not in the compile cache.
+        """
+        dataset = self.datasets.get(key, None)
+        if (dataset is not None) and dataset.id.valid and (dataset.file == group.file):
+            group[name] = dataset
+            self.cache_hits += 1
+            return dataset
+        filename = self.get_cache_index(group).get(key, None)
+        if filename is None:
+            self.cache_misses += 1
+            return None
+        try:
+            f = self.cache_files.get(filename, None)
+            if f is None:
+                f = self.cache_files[filename] = h5py.File(filename, 'r')
+            f.copy(f[key], group, name=name)
+        except (OSError, KeyError) as e:
+            # invalid entry: treat as not existing
+            print("warning: compile cache entry '%s' in '%s' invalid (%s)" % (key, filename, str(e)))
+            if name in group: del group[name]
+            self.cache_index.pop(key, None)
+            self.cache_misses += 1
+            return None
+        dataset = group[name]
+        self.datasets[key] = dataset
+        if DEVICE_HASH in dataset.attrs:
+            self.datasets.setdefault((dataset.attrs[DEVICE_HASH], dataset.dtype.str, dataset.shape), dataset)
+        self.cache_hits += 1
+        return dataset
+
+    def save_compile_cache(self, group):
+        """
+        saves the new compile cache entries of this board into one file of the cache folder of group
+        with one dataset per entry named by its key. the file name is the hex digest of the keys.
+        the file is written into a temporary file which is renamed when done.
+        call after flush_writes since the datasets are copied from the shot file.
+        """
+        if len(self.cache_new) == 0: return
+        digest = sha1()
+        for key, dataset in self.cache_new:
+            digest.update(key.encode())
+        filename = os.path.join(self.get_cache_folder(group), COMPILE_CACHE_FILE % digest.hexdigest())
+        tmp = filename + '.tmp'
+        try:
+            with h5py.File(tmp, 'w') as f:
+                for key, dataset in self.cache_new:
+                    if key not in f:
+                        dataset.file.copy(dataset, f, name=key)
+            os.replace(tmp, filename)
+            for key, dataset in self.cache_new:
+                self.cache_index[key] = filename
+            self.cache_files.setdefault(filename, None)
+        except OSError as e:
+            print("warning: could not save compile cache file '%s' (%s)" % (filename, str(e)))
+        self.cache_new = []
+
+    def close_compile_cache(self):
+        """
+        closes all cache files opened by load_cached_data and updates their access time for least recently used eviction.
+        """
+        for filename, f in self.cache_files.items():
+            if f is None: continue
+            f.close()
+            self.cache_files[filename] = None
+            try:
+                os.utime(filename)
+            except OSError:
+                pass
+
+    @staticmethod
+    def evict_compile_cache(folder, size):
+        """
+        deletes least recently used entries in compile cache folder until the total size is <= size in bytes.
+        returns total size in bytes.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(folder):
+            if entry.is_file() and entry.name.endswith(COMPILE_CACHE_FILE % ''):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for (mtime, entry_size, path) in entries:
+            if total <= size: break
+            try:
+                os.remove(path)
+                total -= entry_size
+            except OSError:
+                pass
+        return total
+
+    def profile_start(self):
+        """
+        starts profiling of a compilation stage. stages can be nested.
+        call profile_stop at the end of the stage.
+        """
+        if not type(self).profile_compile: return
+        memory = 0
+        if type(self).profile_memory and tracemalloc.is_tracing():
+            memory, peak = tracemalloc.get_traced_memory()
+            if len(self.profile_stack) > 0:
+                # keep peak memory of enclosing stage before reset
+                self.profile_stack[-1][2] = max(self.profile_stack[-1][2], peak)
+            tracemalloc.reset_peak()
+        self.profile_stack.append([get_ticks(), memory, memory])
+
+    def profile_stop(self, stage, name):
+        """
+        stops profiling of the last started stage and appends (stage, name, duration in ms, peak bytes) to self.profile.
+        peak bytes = peak of allocated memory above the memory allocated at the start of the stage.
+                     -1 if profile_memory is False.
+        """
+        if not type(self).profile_compile: return
+        t_start, memory, peak = self.profile_stack.pop()
+        duration = (get_ticks() - t_start) * 1e3
+        if type(self).profile_memory and tracemalloc.is_tracing():
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if len(self.profile_stack) > 0:
+                self.profile_stack[-1][2] = max(self.profile_stack[-1][2], peak)
+            tracemalloc.reset_peak()
+            peak -= memory
+        else:
+            peak = -1
+        self.profile.append((stage, name, duration, peak))
+
+    @classmethod
+    def get_storage_options(cls, name, data):
+        """
+        TODO: overwrite in derived class if you need your own implementation.
+        returns dictionary of keyword arguments given to h5py create_dataset for dataset name and data.
+        the options are determined by cls.storage_policy. for options see there.
+        with STORAGE_ADAPTIVE the policy is selected with the fraction of changes of data.
+        this is cheap to compute and separates mostly constant data (like most digital outputs) from dense data (like ramps).
+        """
+        policy = cls.storage_policy
+        if policy is None:
+            return {STORAGE_COMPRESSION: config.compression}
+        elif isinstance(policy, str) and (policy == STORAGE_ADAPTIVE):
+            if (data.nbytes < STORAGE_MIN_BYTES) or (len(data) < 2):
+                return {}
+            changes = np.count_nonzero(data[1:] != data[:-1])
+            policy = STORAGE_POLICY_SPARSE if (changes < STORAGE_SPARSE*len(data)) else STORAGE_POLICY_DENSE
+        elif not isinstance(policy, dict):
+            raise LabscriptError("%s storage_policy %s invalid! give None, '%s' or dictionary." % (cls.__name__, str(policy), STORAGE_ADAPTIVE))
+        options = policy.copy()
+        if len(data) == 0:
+            # empty datasets cannot be chunked
+            return {}
+        if STORAGE_CHUNKS in options:
+            options[STORAGE_CHUNKS] = (min(options[STORAGE_CHUNKS], len(data)),)
+        return options
+
+    def save_static_data(self, group, IM, times):
+        """
+        saves the values of all static channels of IM device as attributes of the DEVICE_STATIC sub-group of the board group.
+        this avoids a time and data dataset for each static IM device and channel.
+        attribute names are the same as the dataset names of dynamic channels.
+        times = static clockline times saved as attribute DEVICE_TIME. for integer ticks saves also DEVICE_RESOLUTION.
+                all static IM devices of the board share the attribute and must have the same times.
+        raises LabscriptError when times are different from the times of another static IM device.
+        """
+        g_static = group.require_group(DEVICE_STATIC)
+        if DEVICE_TIME not in g_static.attrs:
+            g_static.attrs[DEVICE_TIME] = times
+            if times.dtype.kind == 'i':
+                g_static.attrs[DEVICE_RESOLUTION] = type(self).clock_resolution
+        elif not np.array_equal(np.atleast_1d(g_static.attrs[DEVICE_TIME]), times):
+            raise LabscriptError("%s: static device %s times %s are different from times %s of other static devices!" % (
+                                 self.name, IM.name, str(times), str(g_static.attrs[DEVICE_TIME])))
+        path = DEVICE_DEVICES + DEVICE_SEP + self.name + DEVICE_SEP + DEVICE_STATIC
+        addr_type = IM.hardware_type[HARDWARE_ADDRTYPE]
+        if addr_type == HARDWARE_ADDRTYPE_SINGLE:
+            for dev in IM.child_devices:
+                name = DEVICE_DATA_AO % (dev.name, dev.hardware_info[DEVICE_INFO_ADDRESS])
+                g_static.attrs[name] = type(self).combine_channel_data(dev.hardware_info, dev.raw_output, None)[0]
+                dev.hardware_info[DEVICE_INFO_PATH] = path
+        elif addr_type == HARDWARE_ADDRTYPE_MERGED:
+            ports = {}
+            for dev in IM.child_devices:
+                key = (dev.hardware_info[DEVICE_INFO_BOARD], dev.hardware_info[DEVICE_INFO_ADDRESS])
+                try:
+                    ports[key].append(dev)
+                except KeyError:
+                    ports[key] = [dev]
+                dev.hardware_info[DEVICE_INFO_PATH] = path
+            for (board, address), devs in ports.items():
+                data = type(self).combine_port_data([dev.hardware_info for dev in devs], [dev.raw_output for dev in devs])
+                g_static.attrs[DEVICE_DATA_DO % (board, address)] = data[0]
+        elif addr_type == HARDWARE_ADDRTYPE_MULTIPLE:
+            for dev in IM.child_devices:
+                for subdev in dev.child_devices:
+                    name = DEVICE_DATA_DDS % (dev.name, str(dev.hardware_info[DEVICE_INFO_ADDRESS]), subdev.connection)
+                    g_static.attrs[name] = type(self).combine_channel_data(dev.hardware_info, subdev.raw_output, None)[0]
+                dev.hardware_info[DEVICE_INFO_PATH] = path
+        else:
+            print('warning: skip static device %s hardware type %s' % (IM.name, IM.hardware_type))
+
+    @staticmethod
+    def get_channel_stats(IM, times):
+        """
+        returns list of DEVICE_STATS rows for all channels of IM device with clockline times.
+        statistics are of the raw_output of the channels, i.e. before combine_channel_data is applied.
+        """
+        if IM.hardware_type[HARDWARE_ADDRTYPE] == HARDWARE_ADDRTYPE_MULTIPLE:
+            channels = [subdev for dev in IM.child_devices for subdev in dev.child_devices]
+        else:
+            channels = IM.child_devices
+        rows = []
+        for channel in channels:
+            data = np.asarray(channel.raw_output)
+            if len(data) == 0: continue
+            changes = np.flatnonzero(data[1:] != data[:-1])
+            if (len(changes) > 0) and (len(data) == len(times)):
+                last_change = times[changes[-1] + 1]
+            else:
+                last_change = times[0]
+            rows.append((channel.name, len(data), len(changes), data[0], data[-1], np.min(data), np.max(data), last_change, times[-1]))
+        return rows
+
+    @staticmethod
+    def read_stats(group, cache=None):
+        """
+        returns dictionary with key = channel name, value = DEVICE_STATS row of board group or None if no table is saved.
+        cache = None or dictionary as for read_data.
+        """
+        if DEVICE_STATS not in group: return None
+        dataset = group[DEVICE_STATS]
+        if cache is not None:
+            try:
+                return cache[dataset.id]
+            except KeyError:
+                pass
+        stats = {row['name'].decode(): row for row in dataset[()]}
+        if cache is not None:
+            cache[dataset.id] = stats
+        return stats
+
+    @staticmethod
+    def read_static(group, cache=None):
+        """
+        returns dictionary with key = attribute name, value = 1d numpy array of all static values saved in group by save_static_data.
+        all attributes are read at once. cache = None or dictionary as for read_data.
+        """
+        if cache is not None:
+            try:
+                return cache[group.id]
+            except KeyError:
+                pass
+        values = {name: np.atleast_1d(value) for name, value in group.attrs.items()}
+        if cache is not None:
+            cache[group.id] = values
+        return values
+
+    @staticmethod
+    def read_data(group, name, cache=None):
+        """
+        returns decoded data of dataset with given name in group. segments and loops are expanded with expand_segments and expand_loops.
+        cache = None or dictionary with key = HDF5 object id, value = decoded data.
+                datasets saved by save_data as hard links to the same data have the same object id.
+                if given and dataset is in cache returns cached data, otherwise reads data and adds it to cache.
+        if group is the DEVICE_STATIC group returns the static value saved as attribute or None if not existing.
+        """
+        if group.name.split(DEVICE_SEP)[-1] == DEVICE_STATIC:
+            return iPCdev.read_static(group, cache).get(name)
+        dataset = group[name]
+        if dataset.attrs.get(DEVICE_ENCODING, None) == ENCODING_LOOPS:
+            if (cache is not None) and (dataset.id in cache):
+                return cache[dataset.id]
+            data = iPCdev.expand_loops(dataset[()], dataset.attrs[DEVICE_LOOPS], bool(dataset.attrs[DEVICE_DELTA]))
+            if cache is not None:
+                cache[dataset.id] = data
+            return data
+        if dataset.attrs.get(DEVICE_ENCODING, None) == ENCODING_SEGMENTS:
+            # segments are expanded at the times of the group. linked segments might be used with different times.
+            key = (dataset.id, group[DEVICE_TIME].id)
+            if (cache is not None) and (key in cache):
+                return cache[key]
+            data = iPCdev.expand_segments(dataset[()], iPCdev.read_times(group, cache))
+            if DEVICE_INFO_SCALE in dataset.attrs:
+                # segments of DAC codes: expanded as int32 codes which extract_channel_data converts to physical values
+                data = np.round(data).astype(np.int32)
+            if cache is not None:
+                cache[key] = data
+            return data
+        if cache is not None:
+            try:
+                return cache[dataset.id]
+            except KeyError:
+                pass
+        data = iPCdev.decode_changes(dataset[()])
+        if cache is not None:
+            cache[dataset.id] = data
+        return data
+
+    @staticmethod
+    def read_times(group, cache=None, ticks=False):
+        """
+        returns times of the IM device group or of the DEVICE_STATIC group.
+        if ticks is False returns float64 seconds, otherwise int64 number of ticks of the clock resolution.
+        times saved as seconds or as ticks with DEVICE_RESOLUTION attribute are converted as needed.
+        returns None if ticks is True but times are saved in seconds, since then the resolution is unknown.
+        cache = None or dictionary as for read_data. converted times are cached as well.
+        """
+        data = iPCdev.read_data(group, DEVICE_TIME, cache)
+        if data is None: return None
+        stored_ticks = (data.dtype.kind == 'i')
+        if stored_ticks == ticks:
+            return data
+        elif not stored_ticks:
+            return None
+        key = (group.id, DEVICE_RESOLUTION)
+        if cache is not None:
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+        if group.name.split(DEVICE_SEP)[-1] == DEVICE_STATIC:
+            resolution = group.attrs[DEVICE_RESOLUTION]
+        else:
+            resolution = group[DEVICE_TIME].attrs[DEVICE_RESOLUTION]
+        times = data * resolution
+        if cache is not None:
+            cache[key] = times
+        return times
+
     @staticmethod
     def get_trigger_times(dev, device_info):
         """
         returns unsorted list of trigger times from dev.instructions.
         checks that instructions contains only integer or float values.
         removes dev.default_value at time=dev.t0 which is automatically inserted by labscript.
-        note: for many instructions this is very inefficient!
-        """
-        times = []
-        for t, instruction in dev.instructions.items():
-            if not isinstance(instruction, (int, float, np.float64, np.float32)):
-                raise LabscriptError(device_info, "instruction at time %f is of type %s but only integer or real are allowed!" % (t, type(instruction)))
-            elif t != dev.t0 or instruction != dev.default_value:
-                times.append(t)
-        return times
+        times and values are converted into numpy arrays at once and checked vectorized.
+        """
+        times  = np.fromiter(dev.instructions.keys(), dtype=np.float64, count=len(dev.instructions))
+        values = np.array(list(dev.instructions.values()))
+        if (values.ndim != 1) or (values.dtype.kind not in 'biuf'):
+            # find first invalid instruction for error message
+            for t, instruction in dev.instructions.items():
+                if not isinstance(instruction, (int, float, np.integer, np.floating)):
+                    raise LabscriptError("%s instruction at time %f is of type %s but only integer or real are allowed!" % (device_info, t, type(instruction)))
+            raise LabscriptError("%s instructions of type %s but only integer or real are allowed!" % (device_info, values.dtype))
+        return times[(times != dev.t0) | (values != dev.default_value)].tolist()
+
+    @staticmethod
+    def add_gate_triggers(dev, times, device_info):
+        """
+        inserts for all trigger times a rising edge at time - dev.trigger_delay
+        and a falling edge at time - dev.trigger_delay + dev.trigger_duration into dev.gate.instructions.
+        this is the same as calling dev.enable and dev.disable for each time,
+        but all instructions are inserted with one dictionary update.
+        times must be sorted numpy array with spacing >= trigger_delay + trigger_duration.
+        raises LabscriptError for times before dev.gate.t0 and when edges are not strictly increasing,
+        i.e. when triggers overlap and would overwrite each other.
+        the clock limit of the gate is checked by labscript when the clock is generated.
+        """
+        gate = dev.gate
+        edges = np.empty(shape=(2*len(times),), dtype=np.float64)
+        edges[0::2] = times - dev.trigger_delay
+        edges[1::2] = edges[0::2] + dev.trigger_duration
+        # round like labscript Output.add_instruction
+        edges = np.round(edges, ROUND_DIGITS)
+        if edges[0] < gate.t0:
+            raise LabscriptError("%s trigger at time %f - trigger delay %f is before start time %f of '%s'!" % (device_info, times[0], dev.trigger_delay, gate.t0, gate.name))
+        overlap = (np.diff(edges) <= 0)
+        if np.any(overlap):
+            first = np.argmax(overlap)
+            raise LabscriptError("%s gate '%s' edges at time %f and %f overlap! trigger duration %f must be > 0 and triggers must not overlap." % (
+                                 device_info, gate.name, edges[first], edges[first+1], dev.trigger_duration))
+        values = np.tile([1, 0], len(times))
+        gate.instructions.update(zip(edges.tolist(), values.tolist()))
 
     def prepare_generate_code(self, hdf5_file):
         """
         TODO: overwrite in derived class when needed.
-        called from generate_code before any other function is called.
+        not called by iPCdev.generate_code (the call is disabled there). a derived class which uses devices in 'table mode'
+        must call this from its generate_code before iPCdev.generate_code, like benchmark/compile_path.py does.
         implementation details:
         - we search for Trigger device (_trigger):
           we given an error if user programs this manually.
@@ -588,6 +1805,7 @@ class iPCdev(PseudoclockDevice):
           if you want to use the 'enable' command then just do not define trigger_delay and trigger_duration for this channel.
         - unfortunately, labscript already has inserted time=0 instructions when this function is called, so we have to deal with this.
         """
+        self.profile_start()
         for pseudoclock in self.child_devices:
             for clockline in pseudoclock.child_devices:
                 for IM in clockline.child_devices:
@@ -615,23 +1833,24 @@ class iPCdev(PseudoclockDevice):
                                     if (len(dev.gate.instructions) > 1) or (first_value != dev.gate.default_value):
                                         print(dev.gate.instructions)
                                         raise LabscriptError("%s cannot be programmed directly but has %i instructions starting at time %f!\nif you want to use 'enable' and 'disable' remove 'trigger_delay' and 'trigger_duration' from connection_table for this channel!" %
-                                                             device_info, (len(dev.gate.instructions), first_time))
+                                                             (device_info, len(dev.gate.instructions), first_time))
                                 if hasattr(dev, 'instructions') and len(dev.instructions) != 0:
                                     # note: device is intermediate device which has normally no instructions.
-                                    times = iPCdev.get_trigger_times(dev, device_info)
+                                    times = [iPCdev.get_trigger_times(dev, device_info)]
                                 elif len(dev.child_devices) > 0:
                                     # no instructions: check if device has sub-devices (like DDS) with instructions
                                     for sub in dev.child_devices:
                                         if hasattr(sub, 'instructions') and len(sub.instructions) != 0:
-                                            times += iPCdev.get_trigger_times(sub, device_info)
+                                            times.append(iPCdev.get_trigger_times(sub, device_info))
+                                if len(times) > 0:
+                                    # this gives sorted array and ignores same times
+                                    times = np.unique(np.concatenate(times))
                                 if len(times) > 0:
-                                    # this gives sorted list and ignores same times
-                                    times = np.unique(times)
                                     # check that time difference between instructions is > trigger_duration + trigger_delay
                                     trigger_delay    = dev.trigger_delay
                                     trigger_duration = dev.trigger_duration
                                     # manually check times
-                                    # labscript will check negative times
+                                    # negative times are checked in add_gate_triggers
                                     deltas = times[1:]-times[:-1]
                                     mask = (deltas < (trigger_duration + trigger_delay - TIME_EPSILON))
                                     if np.any(mask):
@@ -641,13 +1860,10 @@ class iPCdev(PseudoclockDevice):
                                                 deltas[first], trigger_duration, trigger_delay,
                                                 trigger_duration + trigger_delay))
                                     print(device_info, "adding %i trigger times" % (len(times)))
-                                    print(dev.name, dev.gate.name)
-                                    print(times)
-                                    for t in times:
-                                        #dev.gate.go_high(t - trigger_delay) # this will give an error for negative times.
-                                        #dev.gate.go_low (t - trigger_delay + trigger_duration)
-                                        dev.enable (t - trigger_delay) # this will give an error for negative times.
-                                        dev.disable(t - trigger_delay + trigger_duration)
+                                    # insert all rising and falling edges into gate at once.
+                                    # this is the same as dev.enable(t - trigger_delay) and dev.disable(t - trigger_delay + trigger_duration) for all times.
+                                    iPCdev.add_gate_triggers(dev, times, device_info)
+        self.profile_stop(PROFILE_PREPARE, self.name)
 
     def generate_code(self, hdf5_file):
         """
@@ -658,23 +1874,69 @@ class iPCdev(PseudoclockDevice):
         print("%s generate_code ..." % self.name)
         t_start = get_ticks()
 
+        # loops need all samples of a clockline and are not saved into the compile cache
+        if type(self).loop_compression and ((type(self).stream_memory_limit is not None) or (type(self).compile_cache_size > 0)):
+            raise LabscriptError("%s loop_compression cannot be used with stream_memory_limit %s or compile_cache_size %i!" % (
+                                 self.name, str(type(self).stream_memory_limit), type(self).compile_cache_size))
+
+        # profile memory of all stages. tracemalloc is started by the first board and stopped by the same board at the end.
+        start_tracemalloc = type(self).profile_compile and type(self).profile_memory and not tracemalloc.is_tracing()
+        if start_tracemalloc: tracemalloc.start()
+        self.profile_start()
+
         # prepare generate code in derived class
         # here you can search, modify and insert new device.instructions before labscript generates clocks, times and raw_data.
+        # note: the call is disabled since derived classes call prepare_generate_code from their own generate_code
+        #       and the gate instructions would be inserted twice.
         #self.prepare_generate_code(hdf5_file)
 
+        self.profile_start()
         PseudoclockDevice.generate_code(self, hdf5_file)
+        self.profile_stop(PROFILE_CLOCK, self.name)
         group = hdf5_file[DEVICE_DEVICES].create_group(self.name)
 
         secondary = []
         exp_time = 0.0
+        stats = []
         for pseudoclock in self.child_devices:
             for clockline in pseudoclock.child_devices: # there should be only one
                 times = pseudoclock.times[clockline]
                 if times[-1] > exp_time: exp_time = times[-1]
+                if type(self).time_ticks:
+                    # convert times once into integer ticks of clock resolution
+                    resolution = type(self).clock_resolution
+                    ticks = np.round(times / resolution).astype(np.int64)
+                else:
+                    ticks = times
                 for IM in clockline.child_devices:
+                    if type(self).channel_stats and (IM.hardware_type is not None):
+                        # statistics while raw data is in memory
+                        stats.extend(type(self).get_channel_stats(IM, times))
+                    if (IM.hardware_type is not None) and (len(IM.child_devices) > 0) and \
+                       all([dev.hardware_info[DEVICE_INFO_TYPE][HARDWARE_SUBTYPE] == HARDWARE_SUBTYPE_STATIC for dev in IM.child_devices]):
+                        # static channels are saved as attributes of the static group
+                        self.save_static_data(group, IM, ticks)
+                        continue
+                    # detect loops of clockline from raw data of all channels
+                    if type(self).loop_compression and (IM.hardware_type is not None):
+                        self.profile_start()
+                        if IM.hardware_type[HARDWARE_ADDRTYPE] == HARDWARE_ADDRTYPE_MULTIPLE:
+                            arrays = [subdev.raw_output for dev in IM.child_devices for subdev in dev.child_devices]
+                        else:
+                            arrays = [dev.raw_output for dev in IM.child_devices]
+                        if all([len(array) == len(times) for array in arrays]):
+                            self.loops = type(self).get_loops(times, arrays)
+                        self.profile_stop(PROFILE_LOOPS, IM.name)
                     # create IM device sub-group and save time
                     g_IM = group.create_group(IM.name)
-                    g_IM.create_dataset(DEVICE_TIME, compression=config.compression, data=times)
+                    dataset = self.save_data_stream(g_IM, DEVICE_TIME, len(ticks), lambda start, stop: ticks[start:stop], encode=False,
+                                                    inputs=[(None, times)], delta=True)
+                    if type(self).time_ticks:
+                        if dataset.attrs.get(DEVICE_RESOLUTION, resolution) != resolution:
+                            # linked to same ticks of a board with different resolution: save own dataset
+                            del g_IM[DEVICE_TIME]
+                            dataset = g_IM.create_dataset(DEVICE_TIME, data=ticks, **type(self).get_storage_options(DEVICE_TIME, ticks))
+                        dataset.attrs[DEVICE_RESOLUTION] = resolution
                     # device path
                     path = DEVICE_DEVICES + DEVICE_SEP + self.name + DEVICE_SEP + IM.name
                     if IM.hardware_type is None:
@@ -684,11 +1946,36 @@ class iPCdev(PseudoclockDevice):
                         addr_type = IM.hardware_type[HARDWARE_ADDRTYPE]
                         if addr_type == HARDWARE_ADDRTYPE_SINGLE:
                             # save data for each individual channel
+                            # optional scaling of analog outputs saved as integer DAC codes
+                            scaling = type(self).get_analog_scaling() if (IM.hardware_type[HARDWARE_TYPE] == HARDWARE_TYPE_AO) else None
                             for dev in IM.child_devices:
                                 #print('AO', dev.name, 'address', dev.hardware_info[DEVICE_INFO_ADDRESS])
-                                data = type(self).combine_channel_data(dev.hardware_info, dev.raw_output, None)
                                 dataset = DEVICE_DATA_AO % (dev.name, dev.hardware_info[DEVICE_INFO_ADDRESS])
-                                g_IM.create_dataset(dataset, compression=config.compression, data=data)
+                                if scaling is not None:
+                                    dev.hardware_info.update({DEVICE_INFO_SCALE: scaling[0], DEVICE_INFO_OFFSET: scaling[1]})
+                                if type(self).AO_segments and (IM.hardware_type[HARDWARE_TYPE] == HARDWARE_TYPE_AO):
+                                    # save piecewise-linear segments instead of samples when this needs much less space.
+                                    # segments are detected from the saved values, i.e. from the DAC codes when AO_bits is set.
+                                    self.profile_start()
+                                    data = type(self).quantize_analog_data(dev.hardware_info, type(self).combine_channel_data(dev.hardware_info, dev.raw_output, None))
+                                    segments = type(self).get_segments(times, data)
+                                    self.profile_stop(PROFILE_COMBINE, g_IM.name.split(DEVICE_SEP)[-1] + DEVICE_SEP + dataset)
+                                    if (segments is not None) and (4*segments.nbytes < data.nbytes):
+                                        self.profile_start()
+                                        segments = self.save_data(g_IM, dataset, segments, encode=False)
+                                        segments.attrs[DEVICE_ENCODING] = ENCODING_SEGMENTS
+                                        if scaling is not None:
+                                            segments.attrs[DEVICE_INFO_SCALE]  = scaling[0]
+                                            segments.attrs[DEVICE_INFO_OFFSET] = scaling[1]
+                                        self.profile_stop(PROFILE_WRITE, g_IM.name.split(DEVICE_SEP)[-1] + DEVICE_SEP + dataset)
+                                        dev.hardware_info[DEVICE_INFO_PATH] = path
+                                        continue
+                                dataset = self.save_data_stream(g_IM, dataset, len(dev.raw_output),
+                                    lambda start, stop, dev=dev: type(self).quantize_analog_data(dev.hardware_info, type(self).combine_channel_data(dev.hardware_info, dev.raw_output[start:stop], None)),
+                                    inputs=[(dev.hardware_info, dev.raw_output)])
+                                if scaling is not None:
+                                    dataset.attrs[DEVICE_INFO_SCALE]  = scaling[0]
+                                    dataset.attrs[DEVICE_INFO_OFFSET] = scaling[1]
                                 # save device path into device properties
                                 dev.hardware_info[DEVICE_INFO_PATH] = path
                         elif addr_type == HARDWARE_ADDRTYPE_MERGED:
@@ -698,7 +1985,16 @@ class iPCdev(PseudoclockDevice):
                             # we assume that for each board the address is unique, but different boards might use the same addresses.
                             # therefore, we save dataset for each board and address.
                             # as long as the clocklines are not shared between boards, there will be anyway just one board in the list.
-                            boards = list(set([dev.hardware_info[DEVICE_INFO_BOARD] for dev in IM.child_devices]))
+                            # group channels by board and address in one pass.
+                            ports = {}
+                            for dev in IM.child_devices:
+                                key = (dev.hardware_info[DEVICE_INFO_BOARD], dev.hardware_info[DEVICE_INFO_ADDRESS])
+                                try:
+                                    ports[key].append(dev)
+                                except KeyError:
+                                    ports[key] = [dev]
+                                # save device path into device properties
+                                dev.hardware_info[DEVICE_INFO_PATH] = path
                             if (self.primary is None) and (IM.hardware_type[HARDWARE_SUBTYPE] == HARDWARE_SUBTYPE_TRIGGER):
                                 # add secondary board names from trigger child devices.
                                 # this requires that first channel created is trigger device otherwise subtypse is not trigger.
@@ -711,37 +2007,58 @@ class iPCdev(PseudoclockDevice):
                                     if hardware_info[DEVICE_INFO_TYPE][HARDWARE_SUBTYPE] == HARDWARE_SUBTYPE_TRIGGER:
                                         #print(self.name, "sec board found", trg.name)
                                         secondary.append(next(iter(trg.child_devices)).name)
-                            for board in boards:
+                            for (board, address), devs in ports.items():
                                 # for all channels of the same board and address combine all bits into one data word
-                                addresses = list(set([dev.hardware_info[DEVICE_INFO_ADDRESS] for dev in IM.child_devices if dev.hardware_info[DEVICE_INFO_BOARD] == board]))
-                                for address in addresses:
-                                    data = None
-                                    for dev in IM.child_devices:
-                                        if (dev.hardware_info[DEVICE_INFO_BOARD] == board) and (dev.hardware_info[DEVICE_INFO_ADDRESS] == address):
-                                            data = type(self).combine_channel_data(dev.hardware_info, dev.raw_output, data)
-                                            #print('DO', dev.name, 'address', dev.hardware_info[DEVICE_INFO_ADDRESS], 'channel', dev.hardware_info[DEVICE_INFO_ADDRESS],'data', dev.raw_output, 'combined', data)
-                                            # save device path into device properties
-                                            dev.hardware_info[DEVICE_INFO_PATH] = path
-                                    #print(board, 'DO address', address, 'data:', data)
-                                    dataset = DEVICE_DATA_DO % (board, address)
-                                    g_IM.create_dataset(dataset, compression=config.compression, data=data)
+                                #print(board, 'DO address', address)
+                                dataset = DEVICE_DATA_DO % (board, address)
+                                hardware_infos = [dev.hardware_info for dev in devs]
+                                self.save_data_stream(g_IM, dataset, len(devs[0].raw_output),
+                                    lambda start, stop, devs=devs, hardware_infos=hardware_infos: type(self).combine_port_data(hardware_infos, [dev.raw_output[start:stop] for dev in devs]),
+                                    inputs=[(dev.hardware_info, dev.raw_output) for dev in devs])
                         elif addr_type == HARDWARE_ADDRTYPE_MULTIPLE:
                             # save data for sub-channels like for DDS:
                             for dev in IM.child_devices:
                                 #print('DDS', dev.name, 'address', dev.hardware_info[DEVICE_INFO_ADDRESS])
+                                if type(self).DDS_compound and (len(dev.child_devices) > 0):
+                                    # save all sub-channels into one structured dataset
+                                    subdevs = list(dev.child_devices)
+                                    dataset = DEVICE_DATA_DDS_COMPOUND % (dev.name, str(dev.hardware_info[DEVICE_INFO_ADDRESS]))
+                                    self.save_data_stream(g_IM, dataset, len(subdevs[0].raw_output),
+                                        lambda start, stop, dev=dev, subdevs=subdevs: type(self).combine_dds_data(dev.hardware_info, subdevs, start, stop),
+                                        inputs=[({DEVICE_INFO_TYPE: dev.hardware_info[DEVICE_INFO_TYPE], DEVICE_INFO_CHANNEL: subdev.connection}, subdev.raw_output) for subdev in subdevs])
+                                    dev.hardware_info[DEVICE_INFO_COMPOUND] = True
+                                    dev.hardware_info[DEVICE_INFO_PATH] = path
+                                    continue
                                 for subdev in dev.child_devices:
                                     # print('DDS', subdev.name, dev.hardware_info, subdev.raw_output)
-                                    data = type(self).combine_channel_data(dev.hardware_info, subdev.raw_output, None)
                                     dataset = DEVICE_DATA_DDS % (dev.name, str(dev.hardware_info[DEVICE_INFO_ADDRESS]), subdev.connection)
-                                    g_IM.create_dataset(dataset, compression=config.compression, data=data)
+                                    self.save_data_stream(g_IM, dataset, len(subdev.raw_output),
+                                        lambda start, stop, dev=dev, subdev=subdev: type(self).combine_channel_data(dev.hardware_info, subdev.raw_output[start:stop], None),
+                                        inputs=[(dev.hardware_info, subdev.raw_output)])
                                 # save device path into device properties
                                 dev.hardware_info[DEVICE_INFO_PATH] = path
                         else:
                             print('warning: skip device %s hardware type %s' % (IM.name, IM.hardware_type))
+                        if type(self).stream_memory_limit is not None:
+                            # release raw data of all channels of IM device
+                            for dev in IM.child_devices:
+                                if addr_type == HARDWARE_ADDRTYPE_MULTIPLE:
+                                    for subdev in dev.child_devices:
+                                        subdev.raw_output = None
+                                else:
+                                    dev.raw_output = None
+                    self.loops = None
+
+        # write all chunks compressed in parallel
+        self.flush_writes()
+
+        # save per-channel statistics table
+        if type(self).channel_stats:
+            group.create_dataset(DEVICE_STATS, data=np.array(stats, dtype=STATS_DTYPE))
 
         # this needs to be save into properties otherwise get an error
         if self.stop_time != exp_time:
-            raise LabscriptError('%s stop time %.3e != experiment time %.3e!' % (self.stop_time, exp_time))
+            raise LabscriptError('%s stop time %.3e != experiment time %.3e!' % (self.name, self.stop_time, exp_time))
         self.set_property('stop_time', self.stop_time, location='device_properties')
 
         # note: when generate_code is not existing in intermediate device,
@@ -761,6 +2078,22 @@ class iPCdev(PseudoclockDevice):
             print(self.name, '(secondary) primary board:', self.primary.name)
             self.set_property('is_primary', False, location='connection_table_properties', overwrite=False)
             self.set_property('boards', [self.primary.name], location='connection_table_properties', overwrite=False)
+        self.set_property('all_boards', self.all_boards, location='connection_table_properties', overwrite=False)
+
+        # save new compile cache entries, report and eviction of least recently used files
+        if type(self).compile_cache_size > 0:
+            self.save_compile_cache(group)
+            self.close_compile_cache()
+            group.attrs[DEVICE_CACHE_HITS]   = self.cache_hits
+            group.attrs[DEVICE_CACHE_MISSES] = self.cache_misses
+            total = iPCdev.evict_compile_cache(self.get_cache_folder(group), type(self).compile_cache_size)
+            print("%s compile cache: %i hits, %i misses, %.1f MB" % (self.name, self.cache_hits, self.cache_misses, total/1e6))
+
+        # save profiling table into board group
+        self.profile_stop(PROFILE_TOTAL, self.name)
+        if start_tracemalloc: tracemalloc.stop()
+        if type(self).profile_compile:
+            group.create_dataset(DEVICE_PROFILE, data=np.array(self.profile, dtype=PROFILE_DTYPE))
 
         # experiment duration
         if   exp_time >= 1.0:  tmp = '%.3f s'  % (exp_time)
@@ -13,7 +13,7 @@ from user_devices.iPCdev.labscript_devices import (
     iPCdev,
     DEVICE_DEVICES, DEVICE_SEP,
     DEVICE_HARDWARE_INFO, DEVICE_INFO_PATH, DEVICE_INFO_ADDRESS, DEVICE_INFO_BOARD, DEVICE_INFO_CHANNEL, DEVICE_INFO_TYPE,
-    DEVICE_TIME, DEVICE_DATA_AO, DEVICE_DATA_DO, DEVICE_DATA_DDS,
+    DEVICE_TIME, DEVICE_DATA_AO, DEVICE_DATA_DO, DEVICE_DATA_DDS, DEVICE_DATA_DDS_COMPOUND, DEVICE_INFO_COMPOUND,
     HARDWARE_TYPE, HARDWARE_SUBTYPE, HARDWARE_ADDRTYPE,
     HARDWARE_TYPE_AO, HARDWARE_TYPE_DO, HARDWARE_TYPE_DDS,
     HARDWARE_SUBTYPE_STATIC, HARDWARE_SUBTYPE_TRIGGER
@@ -59,13 +59,18 @@ class iPCdev_parser(object):
 
         with h5py.File(self.path, 'r') as f:
             # load data tables for analog and digital outputs
+            # cache contains already loaded data. shared datasets (hard links) are loaded only once.
+            # static channels are attributes of the board static group which are all loaded with the first channel.
+            cache = {}
             for device in self.channels:
                 hardware_info = device.properties[DEVICE_HARDWARE_INFO]
                 hardware_type = hardware_info[DEVICE_INFO_TYPE]
                 board         = hardware_info[DEVICE_INFO_BOARD] # this is the physical board where the channel belongs.
                 address       = hardware_info[DEVICE_INFO_ADDRESS]
                 group = f[hardware_info[DEVICE_INFO_PATH]]
-                times = group[DEVICE_TIME][()]
+                # statistics table of board. None if not saved.
+                stats = self.device_class_object.read_stats(group.parent, cache)
+                times = self.device_class_object.read_times(group, cache)
                 parent = device.parent
                 if parent.name not in clocklines:
                     # manually insert clockline IM device when not already one. name must be true device name.
@@ -99,18 +104,32 @@ class iPCdev_parser(object):
                         devices = [(device.name, DEVICE_DATA_DO % (board, address), False, True)]
                     else:
                         static = hardware_type[HARDWARE_SUBTYPE] == HARDWARE_SUBTYPE_STATIC
-                        devices = [(device.name, DEVICE_DATA_DO % (board, address), False, False)]
+                        devices = [(device.name, DEVICE_DATA_DO % (board, address), static, False)]
                 elif hardware_type[HARDWARE_TYPE] == HARDWARE_TYPE_DDS:
                     static = hardware_type[HARDWARE_SUBTYPE] == HARDWARE_SUBTYPE_STATIC
-                    devices = [(channel.name, DEVICE_DATA_DDS % (device.name, address, channel.parent_port), static, False) for channel in device.child_list.values()]
+                    if hardware_info.get(DEVICE_INFO_COMPOUND, False):
+                        # one structured dataset with a field for each sub-channel
+                        dataset = DEVICE_DATA_DDS_COMPOUND % (device.name, address)
+                        devices = [(channel.name, (dataset, channel.parent_port), static, False) for channel in device.child_list.values()]
+                    else:
+                        devices = [(channel.name, DEVICE_DATA_DDS % (device.name, address, channel.parent_port), static, False) for channel in device.child_list.values()]
                 else:
                     print("warning: device %s unknown type %s (skip)" % (device.name, hardware_type))
                     continue
                 for (name, dataset, static, trigger) in devices:
-                    data = group[dataset][()]
+                    if not (iPCdev_parser.SHOW_ALL or trigger) and (stats is not None) and (name in stats) and (stats[name]['changes'] == 0):
+                        # skip unused channel without reading its data
+                        continue
+                    # read and decode data saved with encode_changes
+                    if isinstance(dataset, tuple):
+                        # field of structured dataset. this is a view of the data read once.
+                        data = self.device_class_object.read_data(group, dataset[0], cache)
+                        if data is not None: data = data[dataset[1]]
+                    else:
+                        data = self.device_class_object.read_data(group, dataset, cache)
                     if data is None:
                         raise LabscriptError("device %s: dataset %s not existing!" % (name, dataset))
-                    elif static and (len(times) != 2) and (len(data) != 1):
+                    elif static and ((len(times) != 2) or (len(data) != 1)):
                         raise LabscriptError("static device %s: %i/%i times/data but 2/1 expected!" % (name, len(times), len(data)))
                     elif not static and len(times) != len(data):
                         raise LabscriptError("device %s: %i times but %i data!" % (name, len(times), len(data)))
@@ -0,0 +1,26 @@
+# pytest configuration for the iPCdev tests
+# the tests import iPCdev from the repository folder and test only the static encoding and decoding functions of iPCdev.
+# these do not need labscript. when labscript is not installed a minimal stand-in module is used
+# which provides only the names imported by iPCdev.labscript_devices. no device can be created with it.
+
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import labscript
+except ImportError:
+    labscript = types.ModuleType('labscript')
+    class LabscriptError(Exception):
+        pass
+    class Device(object):
+        pass
+    for name in ['IntermediateDevice', 'AnalogOut', 'StaticAnalogOut', 'DigitalOut', 'StaticDigitalOut', 'Trigger',
+                 'DDS', 'StaticDDS', 'Pseudoclock', 'ClockLine', 'PseudoclockDevice']:
+        setattr(labscript, name, type(name, (Device,), {}))
+    labscript.LabscriptError        = LabscriptError
+    labscript.set_passed_properties = lambda *args, **kwargs: (lambda function: function)
+    labscript.config                = types.SimpleNamespace(compression='gzip')
+    sys.modules['labscript'] = labscript
@@ -0,0 +1,163 @@
+# round-trip tests of the encoding and decoding functions of iPCdev
+# run with: python -m pytest -q
+
+import numpy as np
+import pytest
+
+from labscript import LabscriptError
+from iPCdev.labscript_devices import (
+    iPCdev,
+    DEVICE_INFO_ADDRESS, DEVICE_INFO_CHANNEL, DEVICE_INFO_TYPE, DEVICE_INFO_BOARD,
+    HARDWARE_TYPE_DO, HARDWARE_SUBTYPE_NONE, HARDWARE_ADDRTYPE_MERGED,
+    ENCODING_INDEX,
+    DEVICE_INFO_SCALE, DEVICE_INFO_OFFSET,
+    TIME_EPSILON,
+)
+
+def digital_infos(channels, board='board_0', address=1):
+    # returns list of hardware_info of digital channels of one port
+    hardware_type = HARDWARE_TYPE_DO + HARDWARE_SUBTYPE_NONE + HARDWARE_ADDRTYPE_MERGED
+    return [{DEVICE_INFO_ADDRESS: address, DEVICE_INFO_CHANNEL: channel, DEVICE_INFO_TYPE: hardware_type, DEVICE_INFO_BOARD: board}
+            for channel in channels]
+
+def digital_outputs(channels, samples=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 2, samples).astype(np.uint8) for channel in channels]
+
+def test_port_round_trip():
+    channels = [0, 3, 7, 8, 15, 31]
+    infos = digital_infos(channels)
+    raw_outputs = digital_outputs(channels)
+    data = iPCdev.combine_port_data(infos, raw_outputs)
+    assert data.dtype == iPCdev.DO_type
+    # same data as combining each channel with combine_channel_data
+    expected = None
+    for hardware_info, raw_output in zip(infos, raw_outputs):
+        expected = iPCdev.combine_channel_data(hardware_info, raw_output, expected)
+    np.testing.assert_array_equal(data, expected)
+    for channel_data, raw_output in zip(iPCdev.extract_port_data(infos, data), raw_outputs):
+        np.testing.assert_array_equal(channel_data, raw_output.astype(bool))
+        assert not channel_data.flags.writeable
+
+@pytest.mark.parametrize('channels, dtype', [([0, 5], np.uint8), ([0, 9], np.uint16), ([2, 20], np.uint32), ([40], np.uint64)])
+def test_port_compact(channels, dtype):
+    compact = type('compact_iPCdev', (iPCdev,), {'DO_compact': True})
+    infos = digital_infos(channels)
+    raw_outputs = digital_outputs(channels)
+    data = compact.combine_port_data(infos, raw_outputs)
+    assert data.dtype == dtype
+    for channel_data, raw_output in zip(compact.extract_port_data(infos, data), raw_outputs):
+        np.testing.assert_array_equal(channel_data, raw_output.astype(bool))
+
+@pytest.mark.parametrize('channel', [None, -1, 32])
+def test_port_invalid_channel(channel):
+    infos = digital_infos([0, channel], board='board_7', address=3)
+    with pytest.raises(LabscriptError) as error:
+        iPCdev.combine_port_data(infos, digital_outputs([0, channel]))
+    assert ('channel %s of port board_7 address 3' % str(channel)) in str(error.value)
+
+@pytest.mark.parametrize('data', [
+    np.repeat(np.arange(10, dtype=np.uint32), np.arange(1, 11)),
+    np.zeros(100, dtype=np.uint8),
+    np.array([5.0]),
+    np.array([1.0, -1.0, -1.0, 2.5, 2.5, 2.5, 1.0]),
+    np.random.default_rng(0).integers(0, 3, 1000).astype(np.int16),
+])
+def test_changes_round_trip(data):
+    encoded = iPCdev.encode_changes(data)
+    assert encoded[ENCODING_INDEX][0] == 0 and encoded[ENCODING_INDEX][-1] == len(data)
+    assert len(encoded) == np.count_nonzero(data[1:] != data[:-1]) + 2
+    decoded = iPCdev.decode_changes(encoded)
+    assert decoded.dtype == data.dtype
+    np.testing.assert_array_equal(decoded, data)
+
+def test_changes_not_encoded():
+    data = np.arange(10)
+    assert iPCdev.decode_changes(data) is data
+
+def test_changes_port():
+    # digital ports saved with change encoding are extracted like not encoded data
+    channels = [0, 1, 12]
+    infos = digital_infos(channels)
+    raw_outputs = [np.repeat(raw_output[:50], 20) for raw_output in digital_outputs(channels)]
+    encoded = iPCdev.encode_changes(iPCdev.combine_port_data(infos, raw_outputs))
+    for channel_data, raw_output in zip(iPCdev.extract_port_data(infos, encoded), raw_outputs):
+        np.testing.assert_array_equal(channel_data, raw_output.astype(bool))
+
+def ramps(times):
+    # piecewise-linear data: ramp, constant, jump and ramp down
+    return np.interp(times, [0.0, 0.3, 0.5, 0.5 + 1e-9, 1.0], [0.0, 5.0, 5.0, -2.0, -8.0])
+
+def test_segments_round_trip():
+    times = np.linspace(0.0, 1.0, 1001)
+    data = ramps(times)
+    segments = iPCdev.get_segments(times, data)
+    assert segments is not None
+    assert len(segments) <= 4
+    assert np.max(np.abs(iPCdev.expand_segments(segments, times) - data)) <= iPCdev.AO_segment_tolerance
+
+def test_segments_not_linear():
+    # every sample starts a new segment but data is still reproduced
+    times = np.linspace(0.0, 1.0, 100)
+    data = np.random.default_rng(0).uniform(-10, 10, len(times))
+    segments = iPCdev.get_segments(times, data)
+    assert segments is not None
+    np.testing.assert_allclose(iPCdev.expand_segments(segments, times), data, rtol=0, atol=iPCdev.AO_segment_tolerance)
+
+def test_segments_short():
+    assert iPCdev.get_segments(np.array([0.0, 1.0]), np.array([0.0, 1.0])) is None
+
+@pytest.mark.parametrize('bits', [12, 16, 24])
+def test_segments_quantized(bits):
+    # DAC codes of quantized ramps deviate by rounding from a straight line. the tolerance is one code.
+    # the rounding splits ramps into more segments than for float data but much less than the number of samples.
+    quantized = type('quantized_iPCdev', (iPCdev,), {'AO_bits': bits})
+    scale, offset, dtype = quantized.get_analog_scaling()
+    hardware_info = {DEVICE_INFO_SCALE: scale, DEVICE_INFO_OFFSET: offset}
+    times = np.linspace(0.0, 1.0, 1001)
+    codes = quantized.quantize_analog_data(hardware_info, ramps(times))
+    assert codes.dtype == dtype
+    segments = quantized.get_segments(times, codes)
+    assert segments is not None
+    assert len(segments) <= len(times) // 20
+    assert np.max(np.abs(quantized.expand_segments(segments, times) - codes)) <= 1.0
+
+def pulse_train(ticks=False):
+    """
+    returns (times, data) of irregular samples, 100 repetitions of a pulse pattern of 5 samples,
+    50 repetitions of a pattern of 3 samples and irregular samples.
+    times are float seconds or int64 ticks of 1ns.
+    """
+    steps = np.concatenate(([0, 7, 3], np.tile([10, 20, 10, 5, 55], 100), np.tile([4, 4, 2], 50), [13, 1, 8]))
+    data  = np.concatenate(([0, 1, 0], np.tile([1, 0, 1, 1, 0], 100), np.tile([1, 0, 0], 50), [1, 1, 0])).astype(np.uint32)
+    times = np.cumsum(steps)
+    return (times if ticks else np.round(times * 1e-9, 10)), data
+
+@pytest.mark.parametrize('ticks', [False, True])
+def test_loops_round_trip(ticks):
+    times, data = pulse_train(ticks)
+    loops = iPCdev.get_loops(times, [data])
+    assert loops is not None
+    assert np.sum(loops['repeats'] > 1) == 2
+    assert np.sum(loops['length'] * loops['repeats']) == len(times)
+    samples = iPCdev.compress_loops(times, loops, delta=True)
+    assert samples is not None and len(samples) == np.sum(loops['length'])
+    expanded = iPCdev.expand_loops(samples, loops, delta=True)
+    assert expanded.dtype == times.dtype
+    if ticks: np.testing.assert_array_equal(expanded, times)
+    else:     assert np.max(np.abs(expanded - times)) <= TIME_EPSILON
+    samples = iPCdev.compress_loops(data, loops)
+    np.testing.assert_array_equal(iPCdev.expand_loops(samples, loops), data)
+
+def test_loops_not_periodic():
+    rng = np.random.default_rng(0)
+    times = np.cumsum(rng.integers(1, 100, 1000)) * 1e-9
+    assert iPCdev.get_loops(times, [rng.integers(0, 2, 1000)]) is None
+
+def test_loops_other_data():
+    # data which does not repeat like the loops of the clockline cannot be compressed with them
+    times, data = pulse_train()
+    loops = iPCdev.get_loops(times, [data])
+    other = data.copy()
+    other[100] ^= 1
+    assert iPCdev.compress_loops(other, loops) is None